@@ -0,0 +1,200 @@
+"""Scan history rollups behind the analytics API
+
+Three small collections are kept up to date as scan records are written:
+
+- ``scan_rollups_daily``: one document per UTC day (``_id`` ``"YYYY-MM-DD"``)
+- ``scan_rollups_food_daily``: one per day and food item (``_id`` ``"YYYY-MM-DD|food"``)
+- ``scan_rollups_food``: one per food item across all time
+
+Each holds a ``scans`` count and calorie/macro sums. Dashboard queries read
+a handful of these instead of scanning ``scan_history``.
+``rollup_pipelines`` rebuilds all three from history with the aggregation
+framework (``python manage.py backfill-rollups``).
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+
+from pymongo import DESCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DAILY = "scan_rollups_daily"
+FOOD_DAILY = "scan_rollups_food_daily"
+FOOD = "scan_rollups_food"
+
+NUTRIENTS = ("calories", "proteins", "fats", "carbs")
+
+
+def day_key(timestamp):
+    return timestamp.strftime("%Y-%m-%d")
+
+
+def record_increments(record):
+    """``scans`` plus the numeric nutrients of one record ("N/A" counts as 0)"""
+    nutrition = record.get("nutrition_data") or {}
+    increments = {"scans": 1}
+    for nutrient in NUTRIENTS:
+        value = nutrition.get(nutrient)
+        increments[nutrient] = value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+    return increments
+
+
+def summarize(records):
+    """Combine records into one ``$inc`` per rollup document
+
+    Returns ``{(collection, _id): {"inc": {...}, "set": {...}, "last_scanned": ts}}``.
+    """
+    updates = {}
+
+    def add(collection, key, increments, timestamp, fields=None):
+        update = updates.setdefault((collection, key), {"inc": {}, "set": fields or {}, "last_scanned": timestamp})
+        for name, value in increments.items():
+            update["inc"][name] = update["inc"].get(name, 0) + value
+        update["last_scanned"] = max(update["last_scanned"], timestamp)
+
+    for record in records:
+        timestamp = record["timestamp"]
+        day, food_item = day_key(timestamp), record["food_item"]
+        increments = record_increments(record)
+        add(DAILY, day, increments, timestamp)
+        add(FOOD_DAILY, f"{day}|{food_item}", increments, timestamp, {"day": day, "food_item": food_item})
+        add(FOOD, food_item, increments, timestamp)
+    return updates
+
+
+def rollup_updates(records):
+    """``{collection: [(query, update), ...]}``: the upserts applying ``records`` to the rollups"""
+    updates = {}
+    for (collection, key), update in summarize(records).items():
+        document = {"$inc": update["inc"], "$max": {"last_scanned": update["last_scanned"]}}
+        if update["set"]:
+            document["$setOnInsert"] = update["set"]
+        updates.setdefault(collection, []).append(({"_id": key}, document))
+    return updates
+
+
+class RollupWriter:
+    """Applies written scan records to the rollup collections with upserted ``$inc``s
+
+    ``write`` sends one collection's upserts in a single ``bulk_write``.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.records = 0
+        self.updates = 0
+        self.failures = 0
+
+    async def apply(self, records):
+        try:
+            for collection, updates in rollup_updates(records).items():
+                await self.write(self.db[collection], updates)
+                self.updates += len(updates)
+            self.records += len(records)
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def write(self, collection, updates):
+        operations = [UpdateOne(query, update, upsert=True) for query, update in updates]
+        await collection.bulk_write(operations, ordered=False)
+
+    def stats(self):
+        return {"records": self.records, "updates": self.updates, "failures": self.failures}
+
+
+async def ensure_rollup_indexes(db):
+    await db[FOOD_DAILY].create_index("day")
+    await db[FOOD].create_index([("scans", DESCENDING)])
+
+
+def _numeric(nutrient):
+    field = f"$nutrition_data.{nutrient}"
+    return {"$cond": [{"$isNumber": field}, field, 0]}
+
+
+def rollup_pipelines():
+    """Aggregation pipelines that rebuild each rollup collection from ``scan_history``
+
+    Every pipeline ends in a ``$merge`` that replaces matching rollup
+    documents, so a backfill can be re-run safely.
+    """
+    day = {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}
+    sums = {"scans": {"$sum": 1}, **{nutrient: {"$sum": _numeric(nutrient)} for nutrient in NUTRIENTS}}
+    sums["last_scanned"] = {"$max": "$timestamp"}
+
+    def merge(collection):
+        return {"$merge": {"into": collection, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+
+    return {
+        DAILY: [
+            {"$group": {"_id": day, **sums}},
+            merge(DAILY),
+        ],
+        FOOD_DAILY: [
+            {"$group": {"_id": {"day": day, "food_item": "$food_item"}, **sums}},
+            {"$project": {
+                "_id": {"$concat": ["$_id.day", "|", "$_id.food_item"]},
+                "day": "$_id.day", "food_item": "$_id.food_item",
+                "scans": 1, "last_scanned": 1, **{nutrient: 1 for nutrient in NUTRIENTS},
+            }},
+            merge(FOOD_DAILY),
+        ],
+        FOOD: [
+            {"$group": {"_id": "$food_item", **sums}},
+            merge(FOOD),
+        ],
+    }
+
+
+def _totals(document):
+    totals = {"scans": document.get("scans", 0) if document else 0}
+    for nutrient in NUTRIENTS:
+        totals[nutrient] = round(float(document.get(nutrient, 0)), 1) if document else 0.0
+    return totals
+
+
+def _add_totals(into, document):
+    into["scans"] += document["scans"]
+    for nutrient in NUTRIENTS:
+        into[nutrient] = round(into[nutrient] + document[nutrient], 1)
+
+
+async def daily_totals(db, start, end):
+    """One entry per day from ``start`` to ``end`` (inclusive), zero-filled"""
+    cursor = db[DAILY].find({"_id": {"$gte": start.isoformat(), "$lte": end.isoformat()}})
+    documents = {document["_id"]: document async for document in cursor}
+    days = []
+    current = start
+    while current <= end:
+        days.append({"day": current.isoformat(), **_totals(documents.get(current.isoformat()))})
+        current += timedelta(days=1)
+    return days
+
+
+async def weekly_totals(db, weeks, today=None):
+    """Totals per ISO week (Monday start) for the last ``weeks`` weeks, oldest first"""
+    today = today or datetime.utcnow().date()
+    first_monday = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks - 1)
+    totals = []
+    for day in await daily_totals(db, first_monday, today):
+        week_start = date.fromisoformat(day["day"])
+        week_start -= timedelta(days=week_start.weekday())
+        if not totals or totals[-1]["week_start"] != week_start.isoformat():
+            totals.append({"week_start": week_start.isoformat(), **_totals(None)})
+        _add_totals(totals[-1], day)
+    return totals
+
+
+async def top_foods(db, limit, start=None, end=None):
+    """Most scanned food items, across all time or between two days"""
+    if start is None:
+        cursor = db[FOOD].find().sort([("scans", DESCENDING), ("_id", 1)]).limit(limit)
+        return [{"food_item": document["_id"], **_totals(document)} async for document in cursor]
+
+    foods = {}
+    async for document in db[FOOD_DAILY].find({"day": {"$gte": start.isoformat(), "$lte": end.isoformat()}}):
+        food = foods.setdefault(document["food_item"], {"food_item": document["food_item"], **_totals(None)})
+        _add_totals(food, _totals(document))
+    return sorted(foods.values(), key=lambda food: (-food["scans"], food["food_item"]))[:limit]
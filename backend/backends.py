@@ -0,0 +1,217 @@
+"""Pluggable CPU inference backends for the image classifiers
+
+Every backend returns a callable that behaves like a transformers
+image-classification pipeline: ``classifier(image_or_images, top_k=5,
+batch_size=None)`` returns ``[{"label", "score"}, ...]`` for one image or
+a list of such lists for a list of images.
+
+- ``pytorch``: the transformers pipeline, eager fp32 (default)
+- ``int8``: the pipeline with its Linear layers dynamically quantized to int8
+- ``torchscript``: a traced model exported by ``manage.py export-model``
+- ``onnx``: an ONNX Runtime session over a model exported by ``manage.py export-model``
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("pytorch", "int8", "torchscript", "onnx")
+
+TORCHSCRIPT_FILENAME = "model.torchscript.pt"
+ONNX_FILENAME = "model.onnx"
+
+
+def artifact_dir(export_dir, model_name):
+    """Directory holding the exported artifacts of ``model_name``"""
+    return os.path.join(export_dir, model_name.replace("/", "--"))
+
+
+def load_pipeline(model_source, token=None):
+    from transformers import pipeline
+
+    if token:
+        return pipeline("image-classification", model=model_source, token=token)
+    return pipeline("image-classification", model=model_source)
+
+
+class ExportedClassifier:
+    """Pipeline-compatible wrapper around an exported model
+
+    ``run_logits`` maps a float32 ``pixel_values`` numpy array of shape
+    (batch, 3, H, W) to a logits numpy array of shape (batch, labels).
+    Preprocessing uses the model's own image processor, so results match
+    the original pipeline.
+    """
+
+    def __init__(self, run_logits, image_processor, id2label):
+        self.run_logits = run_logits
+        self.image_processor = image_processor
+        self.id2label = {int(index): label for index, label in id2label.items()}
+
+    def __call__(self, images, top_k=5, batch_size=None, **kwargs):
+        import numpy as np
+
+        single = not isinstance(images, (list, tuple))
+        batch = [images] if single else list(images)
+        batch_size = batch_size or len(batch)
+
+        results = []
+        for start in range(0, len(batch), batch_size):
+            chunk = batch[start:start + batch_size]
+            pixel_values = self.image_processor(images=chunk, return_tensors="np")["pixel_values"]
+            logits = np.asarray(self.run_logits(pixel_values.astype(np.float32)), dtype=np.float32)
+            # Softmax, as the image-classification pipeline applies for single-label models
+            logits -= logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            for row in probabilities:
+                top = np.argsort(row)[::-1][:top_k]
+                results.append([{"label": self.id2label[int(i)], "score": float(row[i])} for i in top])
+
+        return results[0] if single else results
+
+
+def _load_processor_and_labels(path):
+    from transformers import AutoConfig, AutoImageProcessor
+
+    config = AutoConfig.from_pretrained(path)
+    return AutoImageProcessor.from_pretrained(path), config.id2label
+
+
+def load_torchscript(path):
+    import torch
+
+    model = torch.jit.load(os.path.join(path, TORCHSCRIPT_FILENAME), map_location="cpu")
+    model.eval()
+    image_processor, id2label = _load_processor_and_labels(path)
+
+    def run_logits(pixel_values):
+        with torch.inference_mode():
+            return model(torch.from_numpy(pixel_values)).numpy()
+
+    return ExportedClassifier(run_logits, image_processor, id2label)
+
+
+def load_onnx(path, intra_op_threads=0):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = onnxruntime.InferenceSession(
+        os.path.join(path, ONNX_FILENAME), options, providers=["CPUExecutionProvider"]
+    )
+    input_name = session.get_inputs()[0].name
+    image_processor, id2label = _load_processor_and_labels(path)
+
+    def run_logits(pixel_values):
+        return session.run(None, {input_name: pixel_values})[0]
+
+    return ExportedClassifier(run_logits, image_processor, id2label)
+
+
+def quantize_int8(classifier):
+    """Dynamically quantize a pipeline's Linear layers to int8 in place"""
+    import torch
+
+    classifier.model = torch.quantization.quantize_dynamic(
+        classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return classifier
+
+
+def load_classifier(backend, model_name, model_source, export_dir, token=None, intra_op_threads=0):
+    """Load ``model_name`` with the given backend
+
+    ``model_source`` is what the pytorch/int8 backends hand to
+    ``pipeline()`` (a Hub id or a local directory). The torchscript and
+    onnx backends read artifacts from ``artifact_dir(export_dir, model_name)``.
+    ``intra_op_threads`` sizes the onnx session's thread pool (0 for one per
+    core); torch's is process-wide and set with ``torch.set_num_threads``.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    if backend == "pytorch":
+        return load_pipeline(model_source, token)
+    if backend == "int8":
+        return quantize_int8(load_pipeline(model_source, token))
+
+    path = artifact_dir(export_dir, model_name)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(
+            f"No exported {backend} model at {path}; run `python manage.py export-model --backend {backend}`"
+        )
+    if backend == "torchscript":
+        return load_torchscript(path)
+    return load_onnx(path, intra_op_threads)
+
+
+def export_model(classifier, backend, path):
+    """Export a loaded pipeline's model to ``path`` for the torchscript or onnx backend
+
+    The image processor and config are saved next to the model so the
+    exported backend loads without the Hub.
+    """
+    import torch
+
+    if backend not in ("torchscript", "onnx"):
+        raise ValueError(f"Backend {backend!r} has nothing to export")
+
+    os.makedirs(path, exist_ok=True)
+    model = classifier.model.eval()
+    model.config.save_pretrained(path)
+    classifier.image_processor.save_pretrained(path)
+
+    size = classifier.image_processor.size
+    height = size.get("height") or size.get("shortest_edge")
+    width = size.get("width") or size.get("shortest_edge")
+    example = torch.rand(1, 3, height, width)
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+
+        def forward(self, pixel_values):
+            return self.wrapped(pixel_values=pixel_values).logits
+
+    wrapped = LogitsOnly(model).eval()
+    with torch.inference_mode():
+        if backend == "torchscript":
+            traced = torch.jit.trace(wrapped, example, check_trace=False)
+            traced = torch.jit.freeze(traced)
+            traced.save(os.path.join(path, TORCHSCRIPT_FILENAME))
+            return os.path.join(path, TORCHSCRIPT_FILENAME)
+
+    torch.onnx.export(
+        wrapped, (example,), os.path.join(path, ONNX_FILENAME),
+        input_names=["pixel_values"], output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=14
+    )
+    return os.path.join(path, ONNX_FILENAME)
+
+
+def check_parity(reference, candidate, images, top_k=1):
+    """Compare top-1 labels of two classifiers over ``images``
+
+    Returns agreement (fraction of images with the same top-1 label), the
+    largest top-1 score difference and the disagreeing cases.
+    """
+    expected = reference(images, top_k=top_k, batch_size=len(images))
+    actual = candidate(images, top_k=top_k, batch_size=len(images))
+    mismatches = []
+    max_score_delta = 0.0
+    for index, (want, got) in enumerate(zip(expected, actual)):
+        if want[0]["label"] != got[0]["label"]:
+            mismatches.append({"index": index, "expected": want[0], "actual": got[0]})
+        else:
+            max_score_delta = max(max_score_delta, abs(want[0]["score"] - got[0]["score"]))
+    return {
+        "images": len(images),
+        "agreement": (len(images) - len(mismatches)) / len(images) if images else None,
+        "max_top1_score_delta": max_score_delta,
+        "mismatches": mismatches,
+    }
@@ -0,0 +1,11 @@
+"""Offline micro-benchmarks and load generator for the MealScan scan pipeline
+
+Run from the backend directory:
+    python -m benchmarks micro --output before.json
+    python -m benchmarks load --requests 500 --concurrency 16 --output before.json
+    python -m benchmarks compare before.json after.json
+
+Nothing leaves the machine: models are replaced by a fixed-latency fake
+using the ``main_simple.py`` mock labels, Open Food Facts by a local stub
+HTTP server and MongoDB by an in-memory stand-in.
+"""
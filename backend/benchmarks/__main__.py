@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from benchmarks import load, micro
+from benchmarks.report import compare, metadata, write_report
+
+
+def add_fake_arguments(parser):
+    parser.add_argument("--call-ms", type=float, default=20.0, help="Fake model cost per call (default: 20)")
+    parser.add_argument("--image-ms", type=float, default=5.0, help="Fake model cost per image (default: 5)")
+    parser.add_argument("--off-latency-ms", type=float, default=20.0,
+                        help="Stub Open Food Facts response delay (default: 20)")
+    parser.add_argument("--output", help="Write the JSON report here instead of printing it")
+
+
+def offline_app(args):
+    from benchmarks.harness import OfflineApp
+
+    return OfflineApp(args.call_ms, args.image_ms, args.off_latency_ms)
+
+
+def micro_command(args):
+    app = offline_app(args)
+    settings = {**app.settings(), **{key: value for key, value in vars(args).items() if key != "func"}}
+    results = asyncio.run(micro.run(app, args))
+    write_report({"meta": metadata("micro", settings), "results": results}, args.output)
+    return 0
+
+
+def load_command(args):
+    app = None if args.url else offline_app(args)
+    settings = {key: value for key, value in vars(args).items() if key != "func"}
+    if app is not None:
+        settings.update(app.settings())
+    results = asyncio.run(load.run(app, args))
+    write_report({"meta": metadata("load", settings), "results": results}, args.output)
+    return 0
+
+
+def compare_command(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["meta"]["kind"] != candidate["meta"]["kind"]:
+        print(f"❌ Cannot compare a {baseline['meta']['kind']} report with a {candidate['meta']['kind']} report")
+        return 2
+    changed = {
+        key for key in baseline["meta"]["settings"].keys() | candidate["meta"]["settings"].keys()
+        if baseline["meta"]["settings"].get(key) != candidate["meta"]["settings"].get(key) and key != "output"
+    }
+    if changed:
+        print(f"⚠️  Settings differ between the reports: {', '.join(sorted(changed))}")
+
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{'metric':<55} {baseline['meta']['git_commit'] or 'before':>12} "
+          f"{candidate['meta']['git_commit'] or 'after':>12} {'change':>9}")
+    for metric, before, after, change in rows:
+        flag = "  ❌" if metric in regressions else ""
+        change_text = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{metric:<55} {before:>12} {after:>12} {change_text:>9}{flag}")
+    if regressions:
+        print(f"❌ {len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+        return 1 if args.fail_on_regression else 0
+    print("✅ No regressions above the threshold")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline MealScan benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    micro_parser = subparsers.add_parser("micro", help="Time decode, validation, inference, nutrition and history")
+    add_fake_arguments(micro_parser)
+    micro_parser.add_argument("--repeat", type=int, default=50, help="Iterations per benchmark (default: 50)")
+    micro_parser.add_argument("--concurrency", type=int, default=16,
+                              help="Concurrent requests for the batching benchmark (default: 16)")
+    micro_parser.add_argument("--history-records", type=int, default=5000,
+                              help="Scan records preloaded for the history benchmarks (default: 5000)")
+    micro_parser.add_argument("--page-size", type=int, default=20)
+    micro_parser.set_defaults(func=micro_command)
+
+    load_parser = subparsers.add_parser("load", help="Drive /api/scan with concurrent clients")
+    add_fake_arguments(load_parser)
+    load_parser.add_argument("--requests", type=int, default=300, help="Measured requests (default: 300)")
+    load_parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests sent first (default: 20)")
+    load_parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (default: 16)")
+    load_parser.add_argument("--images", type=int, default=100,
+                             help="Distinct images cycled through; fewer means more scan cache hits (default: 100)")
+    load_parser.add_argument("--image-width", type=int, default=1024)
+    load_parser.add_argument("--image-height", type=int, default=768)
+    load_parser.add_argument("--seed", type=int, default=0, help="Seed for the generated images (default: 0)")
+    load_parser.add_argument("--url", help="Load a running server instead of the in-process app with fakes")
+    load_parser.set_defaults(func=load_command)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two reports of the same kind")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Relative change counted as a regression (default: 0.1)")
+    compare_parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if anything regressed")
+    compare_parser.set_defaults(func=compare_command)
+
+    args = parser.parse_args()
+    # The app logs every scan at INFO; keep benchmark output readable
+    logging.disable(logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""Offline stand-ins for the models, Open Food Facts and MongoDB"""
+
+import io
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bson import ObjectId
+from PIL import Image, ImageDraw
+from pymongo.errors import BulkWriteError
+
+from analytics import RollupWriter
+from main_simple import MOCK_FOODS
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class FixedLatencyClassifier:
+    """Pipeline-compatible fake with a fixed cost per call and per image
+
+    Each call sleeps ``call_ms + image_ms * len(images)`` (sleep releases
+    the GIL, like a real forward pass on its own threads) and returns the
+    ``main_simple.py`` mock labels. The top label depends only on the
+    image pixels, so runs are reproducible.
+    """
+
+    def __init__(self, call_ms=20.0, image_ms=5.0, labels=None):
+        self.call_seconds = call_ms / 1000
+        self.image_seconds = image_ms / 1000
+        self.labels = labels or MOCK_FOODS
+        self.calls = 0
+        self.images = 0
+
+    def _predict(self, image, top_k):
+        index = zlib.crc32(image.resize((8, 8)).tobytes()) % len(self.labels)
+        ranked = self.labels[index:] + self.labels[:index]
+        return [dict(prediction) for prediction in ranked[:top_k]]
+
+    def __call__(self, images, top_k=5, batch_size=None, **kwargs):
+        single = not isinstance(images, (list, tuple))
+        batch = [images] if single else list(images)
+        self.calls += 1
+        self.images += len(batch)
+        time.sleep(self.call_seconds + self.image_seconds * len(batch))
+        results = [self._predict(image, top_k) for image in batch]
+        return results[0] if single else results
+
+
+def food_photo(seed, size=(1024, 768), image_format="JPEG", quality=90):
+    """Encoded synthetic 'plate of food': textured, saturated, seeded"""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new("RGB", size, (rng.randint(200, 245),) * 3)
+    draw = ImageDraw.Draw(image)
+    margin = min(width, height) // 10
+    draw.ellipse((margin, margin, width - margin, height - margin),
+                 fill=(rng.randint(170, 230), rng.randint(110, 170), rng.randint(30, 80)))
+    for _ in range(150):
+        x, y = rng.randint(margin, width - margin), rng.randint(margin, height - margin)
+        radius = rng.randint(width // 80, width // 25)
+        draw.ellipse((x, y, x + radius, y + radius),
+                     fill=(rng.randint(120, 230), rng.randint(20, 160), rng.randint(10, 80)))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **({"quality": quality} if image_format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        path = urlsplit(self.path)
+        if path.path == "/cgi/search.pl":
+            terms = parse_qs(path.query).get("search_terms", [""])[0]
+            body = {"products": [{"nutriments": server.nutriments(terms)}]}
+        else:
+            body = {"products": []}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubOpenFoodFacts:
+    """Local HTTP server answering Open Food Facts searches with fixed data
+
+    Every search finds one product whose nutriments are derived from the
+    search terms; ``latency_ms`` is added to every response.
+    """
+
+    def __init__(self, latency_ms=20.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency_ms / 1000
+        self.server.requests = 0
+        self.server.nutriments = self.nutriments
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def nutriments(terms):
+        seed = zlib.crc32(terms.encode())
+        return {
+            "energy-kcal_100g": 100 + seed % 300,
+            "proteins_100g": seed % 20,
+            "fat_100g": seed % 15,
+            "carbohydrates_100g": seed % 50,
+        }
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for operator, operand in condition.items():
+                if value is None:
+                    return False
+                if operator == "$lt" and not value < operand:
+                    return False
+                if operator == "$lte" and not value <= operand:
+                    return False
+                if operator == "$gt" and not value > operand:
+                    return False
+                if operator == "$gte" and not value >= operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class MemoryCursor:
+    def __init__(self, documents, projection=None):
+        self._documents = documents
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, keys, direction=None):
+        self._sort = [(keys, direction)] if isinstance(keys, str) else list(keys)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _results(self):
+        documents = list(self._documents)
+        for field, direction in reversed(self._sort or []):
+            documents.sort(key=lambda document: document.get(field), reverse=direction == -1)
+        if self._limit:
+            documents = documents[:self._limit]
+        if self._projection:
+            fields = [field for field, include in self._projection.items() if include]
+            documents = [{field: document[field] for field in fields if field in document} for document in documents]
+        return [dict(document) for document in documents]
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    """The subset of motor's collection API the app uses, kept in a dict"""
+
+    def __init__(self):
+        self.documents = {}
+        self.indexes = []
+
+    async def insert_one(self, document):
+        await self.insert_many([document])
+
+    async def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            if document["_id"] in self.documents:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR})
+                continue
+            self.documents[document["_id"]] = dict(document)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def find(self, query=None, projection=None):
+        return MemoryCursor(
+            [document for document in self.documents.values() if _matches(document, query or {})],
+            projection
+        )
+
+    async def find_one(self, query):
+        for document in self.documents.values():
+            if _matches(document, query):
+                return dict(document)
+        return None
+
+    async def replace_one(self, query, replacement, upsert=False):
+        existing = await self.find_one(query)
+        if existing is not None or upsert:
+            key = existing["_id"] if existing is not None else replacement.get("_id", ObjectId())
+            self.documents[key] = {**replacement, "_id": key}
+
+    async def upsert_many(self, updates):
+        """Apply ``(query, update)`` upserts by ``_id``; handles $setOnInsert, $inc and $max"""
+        for query, update in updates:
+            key = query["_id"]
+            document = self.documents.get(key)
+            if document is None:
+                document = {"_id": key, **update.get("$setOnInsert", {})}
+                self.documents[key] = document
+            for field, amount in update.get("$inc", {}).items():
+                document[field] = document.get(field, 0) + amount
+            for field, value in update.get("$max", {}).items():
+                if field not in document or value > document[field]:
+                    document[field] = value
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+
+    async def estimated_document_count(self):
+        return len(self.documents)
+
+
+class MemoryRollupWriter(RollupWriter):
+    """RollupWriter for a MemoryDatabase: applies the upserts it builds, not pymongo operations"""
+
+    async def write(self, collection, updates):
+        await collection.upsert_many(updates)
+
+
+class MemoryDatabase:
+    """Database stand-in handing out in-memory collections by name"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, MemoryCollection())
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
@@ -0,0 +1,84 @@
+"""Import the real app with every external dependency replaced by a local fake"""
+
+import os
+import tempfile
+
+from benchmarks.fakes import FixedLatencyClassifier, MemoryDatabase, MemoryRollupWriter, StubOpenFoodFacts
+
+CATEGORY_LABELS = [{"label": "fast food", "score": 0.6}, {"label": "main course", "score": 0.3}]
+
+
+class OfflineApp:
+    """``main`` wired to fakes: fixed-latency models, stub OFF server, in-memory MongoDB
+
+    Configuration the app reads from the environment (batch sizes,
+    workers, CATEGORY_MODE, ...) is left alone so it can be varied between
+    runs; only settings that would reach the network are overridden.
+    """
+
+    def __init__(self, call_ms=20.0, image_ms=5.0, off_latency_ms=20.0):
+        self.stub = StubOpenFoodFacts(off_latency_ms).start()
+        self._workdir = tempfile.TemporaryDirectory(prefix="mealscan-bench-")
+
+        # Must be set before main is imported; load_dotenv() won't override them.
+        # Nothing listens on this URI; the short timeout lets anything that
+        # still reaches for the real client give up quickly instead of
+        # holding the process open at exit.
+        os.environ["MONGODB_URI"] = "mongodb://127.0.0.1:1/mealscan?serverSelectionTimeoutMS=200"
+        os.environ["OPENFOODFACTS_API_URL"] = self.stub.url
+        os.environ["NUTRITION_INDEX_PATH"] = ""
+        os.environ["NUTRITION_DB_PATH"] = ""
+        os.environ["NUTRITION_CACHE_FILE"] = ""
+        os.environ["HISTORY_SPILL_PATH"] = os.path.join(self._workdir.name, "history_spill.jsonl")
+        os.environ["THUMBNAIL_DIR"] = os.path.join(self._workdir.name, "thumbnails")
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+        import main
+        from history import HistoryWriter
+        from nutrition_cache import MongoNutritionStore, NutritionCache
+
+        self.main = main
+        self.db = MemoryDatabase()
+        main.db = self.db
+        main.rollup_writer = MemoryRollupWriter(self.db)
+        main.history_writer = HistoryWriter(
+            self.db.scan_history,
+            max_queue=main.HISTORY_QUEUE_SIZE,
+            batch_size=main.HISTORY_BATCH_SIZE,
+            flush_interval=main.HISTORY_FLUSH_INTERVAL,
+            spill_path=os.environ["HISTORY_SPILL_PATH"],
+            on_written=main.rollup_writer.apply
+        )
+        main.nutrition_cache = NutritionCache(
+            MongoNutritionStore(self.db.nutrition_cache),
+            max_entries=main.NUTRITION_CACHE_SIZE,
+            ttl=main.NUTRITION_CACHE_TTL,
+            stale_ttl=main.NUTRITION_CACHE_STALE_TTL
+        )
+        main.food_classifier = FixedLatencyClassifier(call_ms, image_ms)
+        main.food_category_classifier = FixedLatencyClassifier(call_ms, image_ms, labels=CATEGORY_LABELS)
+        main.model_state["status"] = "ready"
+
+    async def start(self):
+        """Start the app's background tasks; the ASGI transport doesn't run the lifespan"""
+        self.main.history_writer.start()
+        self.main.thumbnail_writer.start()
+
+    async def stop(self):
+        await self.main.history_writer.close()
+        await self.main.thumbnail_writer.close()
+        await self.main.off_client.aclose()
+        self.main.inference_executor.shutdown()
+        self.stub.stop()
+        self._workdir.cleanup()
+
+    def settings(self):
+        """App configuration in effect, recorded in every report"""
+        main = self.main
+        return {
+            name: getattr(main, name) for name in (
+                "INFERENCE_WORKERS", "TORCH_THREADS_PER_WORKER", "INFERENCE_QUEUE_SIZE", "INFERENCE_BATCH_SIZE", "INFERENCE_BATCH_WAIT_MS",
+                "IMAGE_DECODE_SIZE", "CATEGORY_MODE", "LOW_CONFIDENCE_THRESHOLD", "PREFILTER_MODE",
+                "SCAN_CACHE_SIZE", "SCAN_CACHE_PERCEPTUAL", "HISTORY_BATCH_SIZE", "HISTORY_FLUSH_INTERVAL",
+            )
+        }
@@ -0,0 +1,76 @@
+"""Concurrent load generator for /api/scan"""
+
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.fakes import food_photo
+from benchmarks.report import summarize
+
+
+async def generate_load(client, uploads, requests, concurrency, warmup):
+    """Send ``requests`` scans from ``concurrency`` workers; returns per-request records"""
+    counter = iter(range(requests + warmup))
+    records = []
+
+    async def worker():
+        for index in counter:
+            contents = uploads[index % len(uploads)]
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/api/scan", files={"file": (f"scan-{index}.jpg", contents, "image/jpeg")}
+                )
+                status, cache = response.status_code, response.headers.get("X-Scan-Cache")
+            except httpx.HTTPError as e:
+                status, cache = type(e).__name__, None
+            if index >= warmup:
+                records.append((time.perf_counter() - started, status, cache))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records, time.perf_counter() - started
+
+
+def load_results(records, elapsed):
+    durations = [duration for duration, status, _ in records if status == 200]
+    summary = summarize(durations, elapsed)
+    summary["requests_per_second"] = summary.pop("ops_per_second")
+    return {
+        "latency": summary,
+        "status_codes": dict(Counter(str(status) for _, status, _ in records)),
+        "scan_cache": dict(Counter(cache or "none" for _, _, cache in records)),
+        "error_rate": round(1 - len(durations) / len(records), 4) if records else None,
+    }
+
+
+async def run(app, args):
+    """Load the in-process app, or a live server when ``args.url`` is set"""
+    uploads = [food_photo(args.seed + index, (args.image_width, args.image_height)) for index in range(args.images)]
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            records, elapsed = await generate_load(client, uploads, args.requests, args.concurrency, args.warmup)
+        return {"target": args.url, **load_results(records, elapsed)}
+
+    await app.start()
+    try:
+        transport = httpx.ASGITransport(app=app.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            records, elapsed = await generate_load(client, uploads, args.requests, args.concurrency, args.warmup)
+            inference = (await client.get("/api/inference/stats")).json()
+        main = app.main
+        results = load_results(records, elapsed)
+        results["server"] = {
+            "food_model_calls": main.food_classifier.calls,
+            "category_model_calls": main.food_category_classifier.calls,
+            "food_batch_size": inference["batchers"]["food"]["batch_size"],
+            "rejected_by_executor": inference["rejected"],
+            "off_requests": app.stub.requests,
+        }
+    finally:
+        await app.stop()
+    results["server"]["history"] = main.history_writer.stats()
+    return {"target": "in-process", **results}
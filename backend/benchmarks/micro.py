@@ -0,0 +1,156 @@
+"""Micro-benchmarks for each stage of a scan"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from benchmarks.fakes import food_photo
+from benchmarks.report import summarize
+
+
+def timed(fn, repeat):
+    """Per-call durations of ``fn()`` over ``repeat`` calls"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+async def timed_async(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def bench_decode(app, repeat):
+    """Header parse plus draft decode/resize of camera-sized and small uploads"""
+    import imaging
+
+    size = app.main.IMAGE_DECODE_SIZE
+    uploads = {
+        "jpeg_4032x3024": food_photo(1, (4032, 3024)),
+        "jpeg_1024x768": food_photo(2, (1024, 768)),
+        "png_1024x768": food_photo(3, (1024, 768), image_format="PNG"),
+    }
+    return {
+        name: summarize(timed(lambda: imaging.decode_image(imaging.open_image(contents), size), repeat))
+        for name, contents in uploads.items()
+    }
+
+
+def bench_validation(app, repeat):
+    """Prefilter and label-table validation on a decoded image"""
+    import imaging
+
+    main = app.main
+    image, _ = imaging.decode_image(imaging.open_image(food_photo(4)), main.IMAGE_DECODE_SIZE)
+    predictions = main.food_classifier(image, top_k=main.FOOD_CLASSIFIER_TOP_K)
+    results = {"is_food_image": summarize(timed(lambda: main.is_food_image(image, predictions), repeat))}
+    if main.food_prefilter is not None:
+        results["prefilter"] = summarize(timed(lambda: main.food_prefilter.check(image), repeat))
+    return results
+
+
+async def bench_inference(app, requests, concurrency):
+    """Single-image requests through the micro-batcher and executor
+
+    The fake model's cost is fixed, so changes here come from queueing,
+    batching and executor overhead.
+    """
+    import imaging
+
+    main = app.main
+    images = [
+        imaging.decode_image(imaging.open_image(food_photo(seed, (320, 240))), main.IMAGE_DECODE_SIZE)[0]
+        for seed in range(min(requests, 32))
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def one(index):
+        async with semaphore:
+            started = time.perf_counter()
+            await main.food_batcher.submit(images[index % len(images)])
+            durations.append(time.perf_counter() - started)
+
+    calls_before = main.food_classifier.calls
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+    calls = main.food_classifier.calls - calls_before
+    return {
+        "batched_submit": summarize(durations, elapsed),
+        "mean_batch_size": round(requests / calls, 2) if calls else None,
+    }
+
+
+async def bench_nutrition(app, repeat):
+    """Open Food Facts lookups over HTTP to the stub, then cache hits"""
+    main = app.main
+    counter = iter(range(10 ** 9))
+    cold = await timed_async(lambda: main.off_client.lookup(f"benchmark food {next(counter)}"), repeat)
+    await main.get_nutrition_data("pizza")
+    warm = await timed_async(lambda: main.get_nutrition_data("pizza"), repeat)
+    return {"off_lookup": summarize(cold), "cached_lookup": summarize(warm)}
+
+
+async def bench_history(app, records, pages, page_size):
+    """/api/history pages (first and deep, via the cursor) and analytics reads"""
+    main = app.main
+    base = datetime(2026, 1, 1)
+    documents = [
+        main.build_scan_record(f"food {index % 40}", {"calories": 100.0 + index % 300, "proteins": 5.0,
+                                                      "fats": 3.0, "carbs": 20.0, "serving_size": "100g"}, 0.8)
+        for index in range(records)
+    ]
+    for index, document in enumerate(documents):
+        document["timestamp"] = base + timedelta(minutes=index)
+    await app.db.scan_history.insert_many(documents)
+    await main.rollup_writer.apply(documents)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        first_page = await timed_async(lambda: client.get("/api/history", params={"limit": page_size}), pages)
+
+        cursor = {"before": None}
+        async def next_page():
+            params = {"limit": page_size, "fields": "food_item,confidence"}
+            if cursor["before"]:
+                params["before"] = cursor["before"]
+            response = await client.get("/api/history", params=params)
+            cursor["before"] = response.headers.get("X-Next-Cursor")
+        paged = await timed_async(next_page, pages)
+
+        last_day = (base + timedelta(minutes=records)).date()
+        daily = await timed_async(
+            lambda: client.get("/api/analytics/daily", params={"end": last_day.isoformat()}), pages
+        )
+        top = await timed_async(lambda: client.get("/api/analytics/top-foods"), pages)
+
+    return {
+        "history_first_page": summarize(first_page),
+        "history_cursor_pages": summarize(paged),
+        "analytics_daily": summarize(daily),
+        "analytics_top_foods": summarize(top),
+    }
+
+
+async def run(app, args):
+    await app.start()
+    try:
+        return {
+            "decode": bench_decode(app, args.repeat),
+            "validation": bench_validation(app, args.repeat * 10),
+            "inference": await bench_inference(app, args.repeat * 10, args.concurrency),
+            "nutrition": await bench_nutrition(app, args.repeat),
+            "history": await bench_history(app, args.history_records, args.repeat, args.page_size),
+        }
+    finally:
+        await app.stop()
@@ -0,0 +1,105 @@
+"""Latency summaries and JSON reports that can be compared across commits"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+REPORT_VERSION = 1
+
+# Metrics where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ("ops_per_second", "requests_per_second")
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return None
+    rank = max(1, round(fraction * len(sorted_samples)))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+def summarize(seconds, elapsed=None):
+    """Latency summary in milliseconds for a list of per-operation durations"""
+    samples = sorted(seconds)
+    summary = {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else None,
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3) if samples else None,
+        "p90_ms": round(percentile(samples, 0.9) * 1000, 3) if samples else None,
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3) if samples else None,
+        "max_ms": round(samples[-1] * 1000, 3) if samples else None,
+    }
+    total = elapsed if elapsed is not None else sum(samples)
+    summary["ops_per_second"] = round(len(samples) / total, 2) if total else None
+    return summary
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def metadata(kind, settings):
+    """Where and how a report was produced, so two reports can be matched up"""
+    return {
+        "version": REPORT_VERSION,
+        "kind": kind,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "git_commit": _git("rev-parse", "--short", "HEAD"),
+        "git_dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+    }
+
+
+def write_report(report, output=None):
+    text = json.dumps(report, indent=2, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {output}")
+    else:
+        print(text)
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(baseline, candidate, threshold=0.1):
+    """Relative change of every numeric result shared by two reports
+
+    Returns ``(rows, regressions)``. A row is ``(metric, before, after,
+    change)``; a regression is a latency metric that grew, or a throughput
+    metric that fell, by more than ``threshold``.
+    """
+    before = _flatten(baseline.get("results", {}))
+    after = _flatten(candidate.get("results", {}))
+    rows, regressions = [], []
+    for metric in sorted(before.keys() & after.keys()):
+        old, new = before[metric], after[metric]
+        change = (new - old) / old if old else None
+        rows.append((metric, old, new, change))
+        if change is None or not metric.endswith(("_ms", "_second")):
+            continue
+        worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+        if worse > threshold:
+            regressions.append(metric)
+    return rows, regressions
@@ -0,0 +1,136 @@
+"""Circuit breaker for calls to an unreliable upstream service"""
+
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open"""
+
+    def __init__(self, name, retry_after):
+        detail = f"retrying in {retry_after:.1f}s" if retry_after > 0 else "a trial call is in flight"
+        super().__init__(f"{name} circuit is open; {detail}")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that is failing or too slow
+
+    The outcome of the last ``window`` calls is kept. Once at least
+    ``min_calls`` are recorded, the breaker opens if the share of failed
+    calls reaches ``failure_rate`` or the share of calls slower than
+    ``slow_call_seconds`` (failed or not) reaches ``slow_call_rate``.
+
+    While open, ``call`` raises ``CircuitOpenError`` without calling the
+    upstream. After ``open_seconds`` one trial call is let through
+    (half-open): if it succeeds quickly the breaker closes with a fresh
+    window, otherwise it opens again.
+    """
+
+    def __init__(self, name="upstream", window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=2.0, slow_call_rate=0.5, open_seconds=30.0, clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    def _admit(self):
+        """``(allowed, trial)`` for a new call"""
+        if self.state == CLOSED:
+            return True, False
+        if self.state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True, True
+        return False, False
+
+    def _open(self, reason):
+        if self.state != OPEN:
+            self.opened += 1
+            logger.warning(f"{self.name} circuit opened: {reason}")
+        self.state = OPEN
+        self._opened_at = self.clock()
+
+    def _record(self, failed, seconds, trial):
+        slow = seconds >= self.slow_call_seconds
+        if trial:
+            self._trial_in_flight = False
+            if failed or slow:
+                self._open("trial call failed" if failed else f"trial call took {seconds:.2f}s")
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info(f"{self.name} circuit closed")
+            return
+
+        self._outcomes.append((failed, slow))
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        failures, slow_calls = self._rates()
+        if failures >= self.failure_rate:
+            self._open(f"{failures:.0%} of the last {len(self._outcomes)} calls failed")
+        elif slow_calls >= self.slow_call_rate:
+            self._open(f"{slow_calls:.0%} of the last {len(self._outcomes)} calls took over {self.slow_call_seconds}s")
+
+    def _rates(self):
+        if not self._outcomes:
+            return 0.0, 0.0
+        total = len(self._outcomes)
+        return (
+            sum(failed for failed, _ in self._outcomes) / total,
+            sum(slow for _, slow in self._outcomes) / total,
+        )
+
+    async def call(self, fn, *args):
+        """Await ``fn(*args)`` unless the breaker is open
+
+        Any exception from ``fn`` counts as a failure and is re-raised.
+        A cancelled call is not counted either way.
+        """
+        allowed, trial = self._admit()
+        if not allowed:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, max(0.0, self.open_seconds - (self.clock() - self._opened_at)))
+
+        started = self.clock()
+        try:
+            result = await fn(*args)
+        except Exception:
+            self._record(True, self.clock() - started, trial)
+            raise
+        except BaseException:
+            # Cancelled: give the trial slot back without judging the upstream
+            if trial:
+                self._trial_in_flight = False
+            raise
+        self._record(False, self.clock() - started, trial)
+        return result
+
+    def stats(self):
+        failures, slow_calls = self._rates()
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "failure_rate": round(failures, 4),
+            "slow_call_rate": round(slow_calls, 4),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,366 @@
+"""Background, batched writes of scan history to MongoDB"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Windows runs a single worker, so there is no one to lock out
+    fcntl = None
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Queued by ``close`` to tell the flush loop to finish its batch and stop
+_STOP = object()
+
+# Newest-first order of /api/history; ``_id`` breaks ties between scans
+# stored in the same millisecond, so every record has one place in it
+HISTORY_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+HISTORY_FIELDS = ("timestamp", "food_item", "confidence", "nutrition_data", "image_url")
+
+
+def encode_record(record):
+    """One JSON line for the spill file; ``_id`` and ``timestamp`` survive the round trip"""
+    encoded = dict(record)
+    if "_id" in encoded:
+        encoded["_id"] = str(encoded["_id"])
+    if isinstance(encoded.get("timestamp"), datetime):
+        encoded["timestamp"] = encoded["timestamp"].isoformat()
+    return json.dumps(encoded, default=str)
+
+
+def decode_record(line):
+    record = json.loads(line)
+    if "_id" in record:
+        record["_id"] = ObjectId(record["_id"])
+    if isinstance(record.get("timestamp"), str):
+        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+    return record
+
+
+class HistoryWriter:
+    """Writes scan records from a bounded in-process queue
+
+    Scans hand records to ``submit`` and move on. A background task
+    collects up to ``batch_size`` records, or whatever arrived within
+    ``flush_interval`` seconds, and writes them with one unordered
+    ``insert_many``. Failed writes are retried with exponential backoff;
+    after ``max_retries`` the batch is appended to ``spill_path`` (JSON
+    lines) and replayed once MongoDB accepts writes again. Records that
+    find the queue full go straight to the spill file, so nothing is
+    dropped while MongoDB is slow.
+
+    ``insert_many`` assigns ``_id`` to each record before sending it, so a
+    retried or replayed record that already landed fails with a duplicate
+    key error and is counted as written.
+
+    ``on_written(records)`` is awaited with the records newly inserted by
+    each write, at most once per record.
+
+    ``close`` gives MongoDB one try per batch, without retries, and
+    spills whatever is left once a write fails or its timeout runs out.
+    """
+
+    def __init__(self, collection, max_queue=10000, batch_size=100, flush_interval=1.0,
+                 max_retries=3, retry_backoff=0.5, spill_path="history_spill.jsonl", on_written=None):
+        self.collection = collection
+        self.max_queue = max_queue
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self.on_written = on_written
+        self._queue = None
+        self._task = None
+        # Records taken off the queue whose write hasn't finished yet
+        self._in_flight = []
+        self._closing = False
+        self.submitted = 0
+        self.written = 0
+        self.flushes = 0
+        self.retries = 0
+        self.overflowed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.flush_seconds = Histogram([0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0])
+        self.flush_size = Histogram([1, 2, 5, 10, 25, 50, 100, 250, 500])
+
+    def start(self):
+        """Start the background flush loop on the running event loop"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, record):
+        """Queue a record for writing; never waits for MongoDB"""
+        self.submitted += 1
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            self._spill([record])
+
+    async def _run(self):
+        """Flush batches until stopped; returns True if it gave up on MongoDB while closing"""
+        await self._replay_spill()
+        stopping = False
+        while not stopping:
+            record = await self._queue.get()
+            if record is _STOP:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._in_flight = batch
+            written = await self._flush(batch)
+            self._in_flight = []
+            if self._closing and written < len(batch):
+                return True
+            if written and self.spill_path and os.path.exists(self.spill_path):
+                await self._replay_spill()
+        return False
+
+    async def _insert(self, batch):
+        """Write ``batch``, retrying failed records; returns the records still unwritten"""
+        pending = batch
+        inserted = []
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                if self._closing:
+                    # Shutting down: close spills the rest rather than wait out the backoff
+                    break
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                await self.collection.insert_many(pending, ordered=False)
+                inserted += pending
+                pending = []
+                break
+            except BulkWriteError as e:
+                # Unordered: everything but the listed records was written
+                errors = e.details.get("writeErrors", [])
+                failed = {error["index"] for error in errors}
+                inserted += [record for index, record in enumerate(pending) if index not in failed]
+                pending = [pending[error["index"]] for error in errors if error.get("code") != DUPLICATE_KEY_ERROR]
+                if not pending:
+                    break
+                logger.warning(f"History write failed for {len(pending)} records: {str(e)}")
+            except Exception as e:
+                logger.warning(f"History write failed (attempt {attempt + 1}): {str(e)}")
+
+        if inserted and self.on_written is not None:
+            try:
+                await self.on_written(inserted)
+            except Exception as e:
+                logger.error(f"History on_written hook failed for {len(inserted)} records: {str(e)}")
+        return pending
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        unwritten = await self._insert(batch)
+        self.flush_seconds.observe(time.perf_counter() - started)
+        self.flush_size.observe(len(batch))
+        self.flushes += 1
+        self.written += len(batch) - len(unwritten)
+        if unwritten:
+            self._spill(unwritten)
+        return len(batch) - len(unwritten)
+
+    @contextmanager
+    def _spill_lock(self):
+        """Exclusive lock on ``<spill_path>.lock``, shared by every worker using the spill file
+
+        Held while appending and while claiming the file for replay, so no
+        worker can append to a file another has already claimed and read.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.spill_path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _spill(self, records):
+        if not self.spill_path:
+            logger.error(f"Dropping {len(records)} history records; no spill file configured")
+            return
+        try:
+            with self._spill_lock(), open(self.spill_path, "a") as f:
+                f.write("".join(encode_record(record) + "\n" for record in records))
+            self.spilled += len(records)
+            logger.warning(f"Spilled {len(records)} history records to {self.spill_path}")
+        except OSError as e:
+            logger.error(f"Could not spill {len(records)} history records: {str(e)}")
+
+    async def _replay_spill(self):
+        """Write records spilled earlier (by any worker) back to MongoDB"""
+        if not self.spill_path:
+            return
+        # Claim the file so other workers don't replay the same records
+        claimed = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            with self._spill_lock():
+                os.replace(self.spill_path, claimed)
+        except FileNotFoundError:
+            return
+
+        records = []
+        with open(claimed) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(decode_record(line))
+                except ValueError:
+                    # A line cut short by a crash mid-write
+                    logger.error(f"Skipping unreadable spilled history record: {line[:80]!r}")
+        os.remove(claimed)
+        logger.info(f"Replaying {len(records)} spilled history records")
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            self._in_flight = records[start:]
+            unwritten = await self._insert(batch)
+            self.replayed += len(batch) - len(unwritten)
+            if unwritten:
+                # Still failing: put the rest back and try again after the next good flush
+                self._in_flight = []
+                self._spill(unwritten + records[start + self.batch_size:])
+                return
+        self._in_flight = []
+
+    async def close(self, timeout=10.0):
+        """Write everything still queued within ``timeout`` seconds, then stop the flush loop
+
+        Each batch gets one write attempt. Once one fails or the time is up
+        the remaining records are spilled, to be replayed on the next start.
+        """
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        self._closing = True
+
+        async def stop():
+            await self._queue.put(_STOP)
+            return await self._task
+
+        try:
+            gave_up = await asyncio.wait_for(stop(), timeout)
+        except asyncio.TimeoutError:
+            # wait_for has cancelled the flush loop mid-write
+            logger.warning(f"History writer did not finish its last batch within {timeout}s")
+            gave_up = True
+
+        # The batch the loop was cut off writing, then records submitted
+        # while it was finishing
+        pending = list(self._in_flight)
+        self._in_flight = []
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not _STOP:
+                pending.append(record)
+
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            remaining = deadline - time.monotonic()
+            if gave_up or remaining <= 0:
+                self._spill(pending[start:])
+                break
+            try:
+                written = await asyncio.wait_for(self._flush(batch), remaining)
+            except asyncio.TimeoutError:
+                # Part of the batch may have landed; replaying it is safe
+                self._spill(pending[start:])
+                break
+            if written < len(batch):
+                # _flush spilled the failed records; don't wait on MongoDB for the rest
+                if pending[start + self.batch_size:]:
+                    self._spill(pending[start + self.batch_size:])
+                break
+        logger.info(f"History writer stopped with {self.written} records written, {self.spilled} spilled")
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "written": self.written,
+            "flushes": self.flushes,
+            "retries": self.retries,
+            "overflowed": self.overflowed,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "flush_seconds": self.flush_seconds.snapshot(),
+            "flush_size": self.flush_size.snapshot(),
+        }
+
+
+async def ensure_history_indexes(collection):
+    """Create the index that serves /api/history pages straight from the index"""
+    await collection.create_index(HISTORY_SORT, name="timestamp_id_desc")
+
+
+def encode_cursor(record):
+    """``<timestamp>,<_id>`` of the last record on a page"""
+    return f"{record['timestamp'].isoformat()},{record['_id']}"
+
+
+def decode_cursor(cursor):
+    """Parse a ``before`` cursor; raises ValueError if it is malformed"""
+    timestamp, _, record_id = cursor.partition(",")
+    try:
+        return datetime.fromisoformat(timestamp), ObjectId(record_id)
+    except (ValueError, InvalidId, TypeError):
+        raise ValueError(f"Invalid history cursor {cursor!r}")
+
+
+def history_filter(before=None):
+    """Records strictly after the ``before`` cursor in newest-first order"""
+    if before is None:
+        return {}
+    timestamp, record_id = decode_cursor(before)
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$lt": record_id}},
+    ]}
+
+
+def history_projection(fields=None):
+    """Projection for a comma-separated ``fields`` list; raises ValueError on unknown names
+
+    ``_id`` and ``timestamp`` are always returned because the cursor is
+    built from them.
+    """
+    requested = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(HISTORY_FIELDS)
+    unknown = [field for field in requested if field not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown history fields: {', '.join(unknown)}")
+    return {field: 1 for field in ["_id", "timestamp", *requested]}
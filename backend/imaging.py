@@ -0,0 +1,83 @@
+"""Image decoding helpers for the MealScan API"""
+
+import io
+import logging
+import time
+
+from PIL import Image
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+TIMING_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+decode_seconds = Histogram(TIMING_BUCKETS)
+resize_seconds = Histogram(TIMING_BUCKETS)
+
+
+def open_image(contents):
+    """Parse the image header without decoding any pixel data
+
+    The returned image is lazy: ``format`` and ``size`` are available
+    immediately, so oversized files can be rejected before decoding.
+    """
+    return Image.open(io.BytesIO(contents))
+
+
+def decode_image(image, target_size=224):
+    """Decode a lazily opened image straight to roughly model resolution
+
+    JPEGs are decoded in draft mode, letting libjpeg scale by 1/2, 1/4 or
+    1/8 while decoding so a 12 MP photo never exists at full size in
+    memory. The result is converted to RGB once and, if still larger,
+    resized so its shorter side is ``target_size`` (aspect ratio kept).
+
+    Returns the image and a dict with ``decode`` and ``resize`` seconds.
+    """
+    started = time.perf_counter()
+    if image.format == "JPEG":
+        # Draft never goes below the requested size, so both sides stay >= target_size
+        image.draft("RGB", (target_size, target_size))
+    image.load()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    decoded = time.perf_counter()
+
+    width, height = image.size
+    shorter_side = min(width, height)
+    if shorter_side > target_size:
+        scale = target_size / shorter_side
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(new_size, Image.BILINEAR, reducing_gap=2.0)
+    resized = time.perf_counter()
+
+    timings = {"decode": decoded - started, "resize": resized - decoded}
+    decode_seconds.observe(timings["decode"])
+    resize_seconds.observe(timings["resize"])
+    return image, timings
+
+
+def perceptual_hash(image, hash_size=8):
+    """Difference hash (dHash) of an image as a 64-bit integer
+
+    Each bit records whether a pixel of a small grayscale thumbnail is
+    brighter than its right-hand neighbour. Re-encoded or rescaled copies
+    of the same photo differ in only a few bits.
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def stats():
+    return {
+        "decode_seconds": decode_seconds.snapshot(),
+        "resize_seconds": resize_seconds.snapshot(),
+    }
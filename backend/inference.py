@@ -0,0 +1,155 @@
+"""Model inference helpers for the MealScan API"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference executor has no room for another job"""
+
+
+class InferenceExecutor:
+    """Runs blocking model calls on a dedicated thread pool
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more
+    may wait for a free worker. Anything beyond that is rejected with
+    ``InferenceQueueFull`` so the caller can shed load instead of letting
+    requests pile up behind the models.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        # Jobs submitted but not finished yet; only touched from the event loop
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def active(self):
+        return min(self._pending, self.max_workers)
+
+    @property
+    def queue_depth(self):
+        return max(0, self._pending - self.max_workers)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result"""
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise InferenceQueueFull(f"Inference queue is full ({self.max_queue} waiting)")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        logger.info("Shutting down inference executor")
+        self._pool.shutdown(wait=True)
+
+
+class MicroBatcher:
+    """Groups concurrent single-image requests into one batched model call
+
+    Requests are collected until ``max_batch_size`` images are waiting or
+    ``max_wait_ms`` has passed since the first one arrived. The batch then
+    runs as a single call to ``batch_fn(images)`` on ``executor`` and every
+    caller receives its own entry of the returned list.
+    """
+
+    def __init__(self, batch_fn, executor, max_batch_size=8, max_wait_ms=10, name="batcher"):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._pending = []
+        self._flush_handle = None
+        # Keep references to running batches so they are not garbage collected
+        self._tasks = set()
+        self.skipped = 0
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_wait = Histogram([0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25])
+
+    async def submit(self, image):
+        """Queue ``image`` for the next batch and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        # Callers that gave up before the batch started (a cancelled
+        # speculative request, a client disconnect) cost no model time
+        live = [item for item in batch if not item[1].done()]
+        self.skipped += len(batch) - len(live)
+        batch = live
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            self.queue_wait.observe(started - enqueued_at)
+        self.batch_size.observe(len(batch))
+
+        images = [image for image, _, _ in batch]
+        try:
+            results = await self.executor.run(self.batch_fn, images)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            # The caller may have gone away (client disconnect) while waiting
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "waiting": len(self._pending),
+            "skipped": self.skipped,
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+        }
@@ -0,0 +1,114 @@
+"""Precomputed food / non-food / category table for classifier labels"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# A label counts as food when it contains one of these; the first match is
+# also its coarse category
+FOOD_KEYWORDS = ['food', 'meal', 'dish', 'pizza', 'burger', 'salad', 'pasta',
+                 'sandwich', 'soup', 'rice', 'chicken', 'beef', 'fish', 'vegetable',
+                 'fruit', 'bread', 'cake', 'cookie', 'drink', 'beverage']
+
+
+def classify_label(label, keywords=FOOD_KEYWORDS):
+    """Return ``(is_food, category)`` for one label by keyword matching"""
+    label_lower = label.lower()
+    for keyword in keywords:
+        if keyword in label_lower:
+            return True, keyword
+    return False, None
+
+
+class LabelTable:
+    """Per-label validation answers computed once when a model loads
+
+    Entry ``i`` of ``food`` and ``category`` describes class id ``i``, and
+    ``index_by_label`` maps the label strings the pipelines return to their
+    class id, so validating a prediction is a dict and a list lookup.
+    Labels outside the model's set (e.g. from a stand-in classifier) are
+    classified on first sight and appended.
+    """
+
+    def __init__(self, keywords=FOOD_KEYWORDS, overrides=None):
+        self.keywords = list(keywords)
+        self.overrides = overrides or {}
+        self.labels = []
+        self.food = []
+        self.category = []
+        self.index_by_label = {}
+
+    def add(self, label):
+        is_food, category = classify_label(label, self.keywords)
+        override = self.overrides.get(label, {})
+        is_food = bool(override.get("food", is_food))
+        category = override.get("category", category)
+
+        index = len(self.labels)
+        self.labels.append(label)
+        self.food.append(is_food)
+        self.category.append(category)
+        self.index_by_label[label] = index
+        return index
+
+    def index(self, label):
+        index = self.index_by_label.get(label)
+        return self.add(label) if index is None else index
+
+    def is_food(self, label):
+        return self.food[self.index(label)]
+
+    def category_of(self, label):
+        return self.category[self.index(label)]
+
+    def stats(self):
+        return {
+            "labels": len(self.labels),
+            "food": sum(self.food),
+            "non_food": len(self.food) - sum(self.food),
+            "overrides": len(self.overrides),
+        }
+
+
+def load_label_config(path):
+    """Read a label table config file, returning ``{}`` if it is missing
+
+    The file may replace the keyword list and override single labels::
+
+        {"keywords": ["pie", "soup", ...],
+         "labels": {"apple_pie": {"food": true, "category": "dessert"}}}
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read label table config {path}: {str(e)}")
+        return {}
+    logger.info(f"Loaded label table config from {path} ({len(config.get('labels', {}))} label overrides)")
+    return config
+
+
+def build_label_table(labels, config=None):
+    """Build the table for ``labels``, a class-id-ordered list or an id2label mapping"""
+    config = config or {}
+    table = LabelTable(config.get("keywords", FOOD_KEYWORDS), config.get("labels"))
+    if isinstance(labels, dict):
+        labels = [labels[index] for index in sorted(labels, key=int)]
+    for label in labels:
+        table.add(label)
+    return table
+
+
+def classifier_labels(classifier):
+    """Class-id-ordered labels of a loaded pipeline or exported classifier, or []"""
+    id2label = getattr(classifier, "id2label", None)
+    if id2label is None:
+        model = getattr(classifier, "model", None)
+        id2label = getattr(getattr(model, "config", None), "id2label", None)
+    if not id2label:
+        return []
+    return [id2label[index] for index in sorted(id2label, key=int)]
@@ -1,17 +1,46 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import os
 from dotenv import load_dotenv
 from typing import List, Optional
-import requests
-from transformers import pipeline
 from PIL import Image
-import io
 import json
+import asyncio
+import hashlib
 import logging
+import time
 import traceback
+from contextlib import asynccontextmanager
+
+from inference import InferenceExecutor, InferenceQueueFull, MicroBatcher
+from nutrition import OpenFoodFactsClient, default_nutrition
+from circuit_breaker import STATES as CIRCUIT_STATES, CircuitBreaker, CircuitOpenError
+from nutrition_cache import NutritionCache, MongoNutritionStore, FileNutritionStore
+from nutrition_index import NutritionIndex
+from nutrition_db import NutritionDatabase
+import imaging
+from metrics import (
+    Counter, Histogram, HistogramFamily, STAGE_BUCKETS, StageTimer, current_stages,
+    process_memory, prometheus_histogram, prometheus_metric, stage
+)
+from backends import artifact_dir, load_classifier
+from scan_cache import ScanResultCache
+from prefilter import FoodPrefilter, NOT_FOOD_MESSAGE
+from labels import build_label_table, classifier_labels, load_label_config
+from analytics import RollupWriter, daily_totals, ensure_rollup_indexes, top_foods, weekly_totals
+from thumbnails import DIGEST_PATTERN, FileThumbnailStore, GridFSThumbnailStore, ThumbnailWriter
+from history import (
+    HistoryWriter, HISTORY_SORT, encode_cursor, ensure_history_indexes, history_filter, history_projection
+)
+from uploads import (
+    UploadBudget, UploadBudgetExceeded, UploadTooLarge, InvalidUpload, read_upload
+)
+
+# Used to report how long after process start the API could serve and was ready
+PROCESS_STARTED_AT = time.time()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,9 +49,209 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="MealScan API")
+# Model calls run on their own thread pool so a slow inference never blocks
+# the event loop. Extra requests wait in a bounded queue; past that we shed load.
+# Each call is itself spread over several cores (see intra_op_threads), so a
+# couple of threads, each taking a micro-batch, keep the CPU busy.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(2, os.cpu_count() or 1))))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+
+# Concurrent scans are grouped into one batched forward pass. A batch is sent
+# when it reaches INFERENCE_BATCH_SIZE images or INFERENCE_BATCH_WAIT_MS expire.
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "10"))
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+
+# Uploads are decoded straight to about the model input size (shorter side in
+# pixels); the pipelines' own 224x224 resize then works on a small image.
+IMAGE_DECODE_SIZE = int(os.getenv("IMAGE_DECODE_SIZE", "224"))
+
+# Uploads are read in chunks. Each file is capped at MAX_UPLOAD_BYTES and the
+# worker holds at most UPLOAD_BUDGET_BYTES of upload data across all requests.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_BUDGET_BYTES = int(os.getenv("UPLOAD_BUDGET_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+ALLOWED_IMAGE_FORMATS = {"JPEG", "MPO", "PNG", "GIF", "WEBP", "BMP"}
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "16"))
+
+upload_budget = UploadBudget(UPLOAD_BUDGET_BYTES)
+
+# Full scan results are cached by SHA-256 of the upload and, optionally, matched
+# by perceptual hash of the decoded image so re-encoded copies also hit.
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "1024"))
+SCAN_CACHE_TTL = float(os.getenv("SCAN_CACHE_TTL", "3600"))
+SCAN_CACHE_PERCEPTUAL = os.getenv("SCAN_CACHE_PERCEPTUAL", "false").lower() in ("1", "true", "yes")
+SCAN_CACHE_PERCEPTUAL_DISTANCE = int(os.getenv("SCAN_CACHE_PERCEPTUAL_DISTANCE", "3"))
+
+scan_result_cache = ScanResultCache(SCAN_CACHE_SIZE, SCAN_CACHE_TTL)
+
+# Cascade stage: a colour/texture check on a thumbnail rejects obvious
+# non-food (blank, single-colour, grayscale, featureless images) before the
+# food classifier runs. See prefilter.FoodPrefilter for the measures.
+# PREFILTER_MODE "enforce" rejects at the prefilter; "shadow" only logs and
+# counts the images it would reject, and whether the food classifier then
+# accepted them, so thresholds can be checked against real traffic first;
+# "off" skips it.
+PREFILTER_MODES = ("off", "shadow", "enforce")
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "shadow").lower()
+if PREFILTER_MODE not in PREFILTER_MODES:
+    raise ValueError(f"Unknown PREFILTER_MODE {PREFILTER_MODE!r}; expected one of {', '.join(PREFILTER_MODES)}")
+PREFILTER_MIN_SATURATION = float(os.getenv("PREFILTER_MIN_SATURATION", "0.03"))
+PREFILTER_MAX_UNIFORM_FRACTION = float(os.getenv("PREFILTER_MAX_UNIFORM_FRACTION", "0.95"))
+PREFILTER_MIN_DETAIL = float(os.getenv("PREFILTER_MIN_DETAIL", "0.004"))
+PREFILTER_THUMBNAIL_SIZE = int(os.getenv("PREFILTER_THUMBNAIL_SIZE", "128"))
+
+food_prefilter = FoodPrefilter(
+    min_saturation=PREFILTER_MIN_SATURATION,
+    max_uniform_fraction=PREFILTER_MAX_UNIFORM_FRACTION,
+    min_detail=PREFILTER_MIN_DETAIL,
+    thumbnail_size=PREFILTER_THUMBNAIL_SIZE
+) if PREFILTER_MODE != "off" else None
+
+# Open Food Facts is reached through one pooled async client. The deadline
+# covers the whole lookup, including the category fallback request.
+OPENFOODFACTS_API_URL = os.getenv("OPENFOODFACTS_API_URL", "https://world.openfoodfacts.org")
+OFF_REQUEST_TIMEOUT = float(os.getenv("OFF_REQUEST_TIMEOUT", "5"))
+OFF_LOOKUP_DEADLINE = float(os.getenv("OFF_LOOKUP_DEADLINE", "8"))
+OFF_MAX_CONNECTIONS = int(os.getenv("OFF_MAX_CONNECTIONS", "20"))
+OFF_MAX_PER_HOST = int(os.getenv("OFF_MAX_PER_HOST", "8"))
+
+off_client = OpenFoodFactsClient(
+    OPENFOODFACTS_API_URL,
+    request_timeout=OFF_REQUEST_TIMEOUT,
+    deadline=OFF_LOOKUP_DEADLINE,
+    max_connections=OFF_MAX_CONNECTIONS,
+    max_per_host=OFF_MAX_PER_HOST
+)
+
+# When too many recent lookups failed or were slow, stop calling Open Food
+# Facts for OFF_BREAKER_OPEN_SECONDS and answer from the cache (however
+# old) or default values. One trial lookup then decides whether to resume.
+OFF_BREAKER_WINDOW = int(os.getenv("OFF_BREAKER_WINDOW", "20"))
+OFF_BREAKER_MIN_CALLS = int(os.getenv("OFF_BREAKER_MIN_CALLS", "5"))
+OFF_BREAKER_FAILURE_RATE = float(os.getenv("OFF_BREAKER_FAILURE_RATE", "0.5"))
+OFF_BREAKER_SLOW_SECONDS = float(os.getenv("OFF_BREAKER_SLOW_SECONDS", "2"))
+OFF_BREAKER_SLOW_RATE = float(os.getenv("OFF_BREAKER_SLOW_RATE", "0.5"))
+OFF_BREAKER_OPEN_SECONDS = float(os.getenv("OFF_BREAKER_OPEN_SECONDS", "30"))
+
+off_breaker = CircuitBreaker(
+    "Open Food Facts",
+    window=OFF_BREAKER_WINDOW,
+    min_calls=OFF_BREAKER_MIN_CALLS,
+    failure_rate=OFF_BREAKER_FAILURE_RATE,
+    slow_call_seconds=OFF_BREAKER_SLOW_SECONDS,
+    slow_call_rate=OFF_BREAKER_SLOW_RATE,
+    open_seconds=OFF_BREAKER_OPEN_SECONDS
+)
+
+# End-to-end budget in seconds for one scan request. The nutrition step only
+# gets what is left of it, so a slow Open Food Facts can't hold a scan past it.
+SCAN_DEADLINE = float(os.getenv("SCAN_DEADLINE", "5"))
+
+@asynccontextmanager
+async def lifespan(app):
+    index_task = None
+    if history_writer is not None:
+        history_writer.start()
+        # In the background: an unreachable MongoDB must not hold up startup
+        index_task = asyncio.create_task(create_history_indexes())
+    if thumbnail_writer is not None:
+        thumbnail_writer.start()
+    if food_classifier is None:
+        loader = asyncio.create_task(asyncio.to_thread(load_models, configure_threads=True))
+    elif MODEL_WARMUP:
+        # Models were preloaded by the prefork parent; only warm them up here
+        loader = asyncio.create_task(asyncio.to_thread(warm_up_preloaded_models))
+    else:
+        loader = asyncio.create_task(asyncio.sleep(0))
+    model_state["serving_after_seconds"] = round(time.time() - PROCESS_STARTED_AT, 3)
+    logger.info(f"Serving after {model_state['serving_after_seconds']}s; loading models in the background")
+    yield
+    if not loader.done():
+        logger.info("Waiting for model loading to finish before shutting down")
+        await asyncio.gather(loader, return_exceptions=True)
+    if index_task is not None and not index_task.done():
+        index_task.cancel()
+    if history_writer is not None:
+        await history_writer.close(HISTORY_CLOSE_TIMEOUT)
+    if thumbnail_writer is not None:
+        await thumbnail_writer.close(THUMBNAIL_CLOSE_TIMEOUT)
+    await off_client.aclose()
+    inference_executor.shutdown()
+
+app = FastAPI(title="MealScan API", lifespan=lifespan)
+
+async def create_history_indexes():
+    try:
+        await client.admin.command("ping")
+        logger.info("Successfully connected to MongoDB")
+        await ensure_history_indexes(db.scan_history)
+        await ensure_rollup_indexes(db)
+        logger.info("Ensured scan history and rollup indexes")
+    except Exception as e:
+        logger.error(f"Could not create scan history indexes: {str(e)}")
+
+def upload_too_large_message():
+    return f"Image too large. Maximum upload size is {MAX_UPLOAD_BYTES / (1024 * 1024):.1f}MB."
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse scan uploads whose declared size is over the limit before reading the body"""
+    if request.url.path.startswith("/api/scan"):
+        max_files = MAX_BATCH_FILES if request.url.path == "/api/scan/batch" else 1
+        content_length = request.headers.get("content-length")
+        # Allow some room for the multipart boundaries and part headers
+        if content_length and content_length.isdigit() and int(content_length) > max_files * (MAX_UPLOAD_BYTES + 64 * 1024):
+            return JSONResponse(status_code=413, content={"detail": upload_too_large_message()})
+    return await call_next(request)
+
+# Every request is split into named stages (read, decode, food_model, ...).
+# Their durations go back to the client in a Server-Timing header and into
+# the histograms served by /metrics. Streamed responses (/api/scan/batch)
+# only cover the stages that ran before the first line was sent.
+request_seconds = HistogramFamily(("route", "method"), STAGE_BUCKETS)
+stage_seconds = HistogramFamily(("route", "stage"), STAGE_BUCKETS)
+requests_total = Counter()
+# Open Food Facts lookups by outcome (found, not_found, timeout, error, or
+# circuit_open when the breaker answered without calling it)
+off_lookups = Counter()
+off_lookup_seconds = Histogram(STAGE_BUCKETS)
+# Requests answered without MongoDB because it was not configured or reachable
+db_fallbacks = Counter()
+# Scans refused as not food, by the stage that refused them (prefilter or
+# classifier), and shadow-mode prefilter failures by what the classifier
+# then decided (rejected, or accepted: a prefilter false reject)
+not_food_rejections = Counter()
+prefilter_shadow = Counter()
+
+@app.middleware("http")
+async def time_request_stages(request: Request, call_next):
+    timer = StageTimer()
+    token = current_stages.set(timer)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_stages.reset(token)
+    total = time.perf_counter() - started
+
+    # The route template, so /metrics doesn't get one series per URL
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    response.headers["Server-Timing"] = timer.server_timing(total)
+    # Lets the frontend, served from another origin, read the timings
+    response.headers["Timing-Allow-Origin"] = "*"
+    request_seconds.observe(total, route, request.method)
+    for name, seconds in timer.durations.items():
+        stage_seconds.observe(seconds, route, name)
+    requests_total.inc(route=route, method=request.method, status=response.status_code)
+    return response
 
-# Configure CORS - More permissive during development
+# Configure CORS - More permissive during development. Added after the
+# middleware above so it is the outermost layer and its headers are also
+# set on responses they return themselves, such as the 413 for oversized
+# uploads.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # More permissive during development
@@ -37,93 +266,351 @@ MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/mealscan")
 logger.info(f"Using MongoDB URI: {MONGODB_URI}")
 
 try:
-    client = AsyncIOMotorClient(MONGODB_URI)
-    # Test the connection
-    client.admin.command('ping')
+    # No I/O at import: Motor binds the client to the event loop of its first
+    # operation, which must be the serving loop. Under manage.py serve this
+    # module is imported by the prefork parent, before any loop exists, and
+    # every forked worker then connects on its own loop. The connection is
+    # checked in the background at startup (see create_history_indexes).
+    client = AsyncIOMotorClient(MONGODB_URI, connect=False)
     db = client.mealscan
-    logger.info("Successfully connected to MongoDB")
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {str(e)}")
     logger.error(traceback.format_exc())
     # Don't raise - allow app to run without MongoDB for testing
     db = None
 
+# Scan history is written by a background task in unordered batches so MongoDB
+# latency never adds to scan latency. Batches that still fail after retries
+# are appended to HISTORY_SPILL_PATH and replayed once MongoDB is back.
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+HISTORY_MAX_RETRIES = int(os.getenv("HISTORY_MAX_RETRIES", "3"))
+HISTORY_RETRY_BACKOFF = float(os.getenv("HISTORY_RETRY_BACKOFF", "0.5"))
+HISTORY_SPILL_PATH = os.getenv("HISTORY_SPILL_PATH", "history_spill.jsonl")
+# Seconds shutdown waits for queued records to be written before spilling them
+HISTORY_CLOSE_TIMEOUT = float(os.getenv("HISTORY_CLOSE_TIMEOUT", "10"))
+# Largest page /api/history returns, whatever ``limit`` asks for
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "100"))
+
+# Per-day and per-food rollups for /api/analytics, updated from every batch
+# the history writer stores
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "366"))
+rollup_writer = RollupWriter(db) if db is not None else None
+
+history_writer = HistoryWriter(
+    db.scan_history,
+    max_queue=HISTORY_QUEUE_SIZE,
+    batch_size=HISTORY_BATCH_SIZE,
+    flush_interval=HISTORY_FLUSH_INTERVAL,
+    max_retries=HISTORY_MAX_RETRIES,
+    retry_backoff=HISTORY_RETRY_BACKOFF,
+    spill_path=HISTORY_SPILL_PATH,
+    on_written=rollup_writer.apply
+) if db is not None else None
+
+# Scan thumbnails for history. A background task makes them from the decoded
+# image and stores each distinct upload once, named by its SHA-256: under
+# THUMBNAIL_DIR if set, else in the "thumbnails" GridFS bucket.
+THUMBNAILS_ENABLED = os.getenv("THUMBNAILS_ENABLED", "true").lower() in ("1", "true", "yes")
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR")
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "160"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "WEBP")
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+THUMBNAIL_QUEUE_SIZE = int(os.getenv("THUMBNAIL_QUEUE_SIZE", "100"))
+# Seconds shutdown waits for queued thumbnails to be stored before dropping them
+THUMBNAIL_CLOSE_TIMEOUT = float(os.getenv("THUMBNAIL_CLOSE_TIMEOUT", "5"))
+
+if not THUMBNAILS_ENABLED:
+    thumbnail_store = None
+elif THUMBNAIL_DIR:
+    thumbnail_store = FileThumbnailStore(THUMBNAIL_DIR)
+elif db is not None:
+    thumbnail_store = GridFSThumbnailStore(db)
+else:
+    thumbnail_store = None
+
+thumbnail_writer = ThumbnailWriter(
+    thumbnail_store,
+    max_queue=THUMBNAIL_QUEUE_SIZE,
+    size=THUMBNAIL_SIZE,
+    image_format=THUMBNAIL_FORMAT,
+    quality=THUMBNAIL_QUALITY
+) if thumbnail_store is not None else None
+
+# Nutrition results are cached per normalized food label: an in-process LRU in
+# front of a persistent tier (a local JSON file if configured, else MongoDB).
+NUTRITION_CACHE_SIZE = int(os.getenv("NUTRITION_CACHE_SIZE", "512"))
+NUTRITION_CACHE_TTL = float(os.getenv("NUTRITION_CACHE_TTL", str(24 * 3600)))
+NUTRITION_CACHE_STALE_TTL = float(os.getenv("NUTRITION_CACHE_STALE_TTL", str(7 * 24 * 3600)))
+NUTRITION_CACHE_FILE = os.getenv("NUTRITION_CACHE_FILE")
+
+if NUTRITION_CACHE_FILE:
+    nutrition_store = FileNutritionStore(NUTRITION_CACHE_FILE)
+elif db is not None:
+    nutrition_store = MongoNutritionStore(db.nutrition_cache)
+else:
+    nutrition_store = None
+
+# Precomputed nutrition for every classifier label (see manage.py
+# build-nutrition-index). Labels missing from it use the live lookup.
+NUTRITION_INDEX_PATH = os.getenv("NUTRITION_INDEX_PATH", "nutrition_index.json")
+nutrition_index = NutritionIndex.load(NUTRITION_INDEX_PATH)
+
+# Optional local copy of Open Food Facts built from its bulk dump (see
+# manage.py ingest-off-dump). When present, labels missing from the index
+# are searched there instead of over the network.
+NUTRITION_DB_PATH = os.getenv("NUTRITION_DB_PATH", "off_nutrition.db")
+nutrition_db = NutritionDatabase.open(NUTRITION_DB_PATH)
+
+nutrition_cache = NutritionCache(
+    nutrition_store,
+    max_entries=NUTRITION_CACHE_SIZE,
+    ttl=NUTRITION_CACHE_TTL,
+    stale_ttl=NUTRITION_CACHE_STALE_TTL
+)
+
 # Initialize Hugging Face models with API key
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 if not HUGGINGFACE_API_KEY:
     logger.warning("HUGGINGFACE_API_KEY not set. Using models without authentication (may have rate limits)")
 
-try:
-    # Load models with smaller size
-    if HUGGINGFACE_API_KEY:
-        food_classifier = pipeline(
-            "image-classification",
-            model="nateraw/food",
-            token=HUGGINGFACE_API_KEY
-        )
-        food_category_classifier = pipeline(
-            "image-classification",
-            model="Kaludi/food-category-classification-v2.0",
-            token=HUGGINGFACE_API_KEY
-        )
-    else:
-        # Try without token (may have rate limits)
-        food_classifier = pipeline(
-            "image-classification",
-            model="nateraw/food"
-        )
-        food_category_classifier = pipeline(
-            "image-classification",
-            model="Kaludi/food-category-classification-v2.0"
-        )
-    logger.info("Successfully loaded Hugging Face models")
-except Exception as e:
-    logger.error(f"Failed to load Hugging Face models: {str(e)}")
-    logger.error(traceback.format_exc())
-    # Set to None to handle gracefully
-    food_classifier = None
-    food_category_classifier = None
+FOOD_MODEL = "nateraw/food"
+CATEGORY_MODEL = "Kaludi/food-category-classification-v2.0"
+
+# Optional directory of pre-downloaded models (see manage.py download-models).
+# When set, models load from disk and no Hugging Face Hub calls are made.
+MODEL_DIR = os.getenv("MODEL_DIR")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# How the classifiers run on CPU: pytorch (eager fp32), int8 (dynamic
+# quantization), or torchscript/onnx artifacts from manage.py export-model,
+# read from MODEL_DIR (default ./models).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch").lower()
+
+# Every forward pass also fans out over the backend's intra-op thread pool,
+# which defaults to one thread per core, so INFERENCE_WORKERS threads in each
+# of several processes would oversubscribe the CPU many times over. The cores
+# are split between them instead, unless TORCH_THREADS_PER_WORKER sets the
+# intra-op thread count of each process directly.
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+
+def intra_op_threads(processes=1):
+    """Intra-op threads per inference call when ``processes`` serving processes share the CPU"""
+    if TORCH_THREADS_PER_WORKER > 0:
+        return TORCH_THREADS_PER_WORKER
+    return max(1, (os.cpu_count() or 1) // (processes * INFERENCE_WORKERS))
+
+def set_intra_op_threads(processes=1):
+    """Size torch's intra-op pool for this process; call before its first inference"""
+    threads = intra_op_threads(processes)
+    model_state["intra_op_threads"] = threads
+    if INFERENCE_BACKEND != "onnx":
+        import torch
+        torch.set_num_threads(threads)
+    logger.info(f"Using {threads} intra-op threads for each of {INFERENCE_WORKERS} inference threads")
+
+# Models load in the background after startup, so the API can serve (and
+# report liveness) immediately. Scans get 503 until they are ready.
+food_classifier = None
+food_category_classifier = None
+model_state = {
+    "status": "pending",
+    "error": None,
+    "load_seconds": {},
+    "warmup_seconds": None,
+    "serving_after_seconds": None,
+    "ready_after_seconds": None,
+    "intra_op_threads": None,
+}
+
+# Food / non-food / category answers for every food classifier label, built
+# once the model is loaded. LABEL_TABLE_PATH may replace the keyword list or
+# override single labels (see labels.load_label_config).
+LABEL_TABLE_PATH = os.getenv("LABEL_TABLE_PATH", "label_table.json")
+label_config = load_label_config(LABEL_TABLE_PATH)
+food_label_table = build_label_table([], label_config)
+
+def local_model_path(model_name):
+    """Directory a model is saved to under MODEL_DIR"""
+    return artifact_dir(MODEL_DIR, model_name)
+
+def load_pipeline(model_name, threads=0):
+    model_source = local_model_path(model_name) if MODEL_DIR else model_name
+    return load_classifier(
+        INFERENCE_BACKEND, model_name, model_source,
+        export_dir=MODEL_DIR or "models",
+        # Models under MODEL_DIR load from disk; otherwise try without token (may have rate limits)
+        token=None if MODEL_DIR else HUGGINGFACE_API_KEY,
+        intra_op_threads=threads
+    )
+
+def warm_up(classifiers):
+    """Run one inference per model so lazy initialisation happens before traffic"""
+    started = time.perf_counter()
+    warmup_image = Image.new("RGB", (IMAGE_DECODE_SIZE, IMAGE_DECODE_SIZE))
+    for classifier in classifiers:
+        classifier(warmup_image)
+    model_state["warmup_seconds"] = round(time.perf_counter() - started, 3)
+
+def mark_ready():
+    model_state["status"] = "ready"
+    model_state["ready_after_seconds"] = round(time.time() - PROCESS_STARTED_AT, 3)
+    logger.info(f"Hugging Face models ready after {model_state['ready_after_seconds']}s")
+
+def load_models(warmup=None, processes=1, configure_threads=False):
+    """Load both pipelines and run a warm-up inference; runs in a worker thread
+
+    The prefork server calls this in the parent with ``warmup=False`` so
+    the weights are shared copy-on-write with the forked workers, and
+    ``processes`` set to the number of workers, which share the CPU. The
+    workers size torch's thread pool after fork; a single-process server
+    passes ``configure_threads`` to do it here, off the event loop, since
+    it imports torch.
+    """
+    global food_classifier, food_category_classifier, food_label_table
 
-def is_food_image(image):
-    """Validate if the uploaded image is likely to be food"""
+    if warmup is None:
+        warmup = MODEL_WARMUP
+    model_state["status"] = "loading"
+    try:
+        if configure_threads:
+            set_intra_op_threads(processes)
+        loaded = {}
+        model_state["backend"] = INFERENCE_BACKEND
+        for key, model_name in (("food", FOOD_MODEL), ("category", CATEGORY_MODEL)):
+            started = time.perf_counter()
+            loaded[key] = load_pipeline(model_name, intra_op_threads(processes))
+            model_state["load_seconds"][key] = round(time.perf_counter() - started, 3)
+            logger.info(f"Loaded {model_name} ({INFERENCE_BACKEND}) in {model_state['load_seconds'][key]}s")
+
+        if warmup:
+            warm_up([loaded["food"], loaded["category"]])
+
+        food_label_table = build_label_table(classifier_labels(loaded["food"]), label_config)
+        logger.info(f"Built label table: {food_label_table.stats()}")
+        food_classifier = loaded["food"]
+        food_category_classifier = loaded["category"]
+        logger.info("Successfully loaded Hugging Face models")
+        mark_ready()
+    except Exception as e:
+        logger.error(f"Failed to load Hugging Face models: {str(e)}")
+        logger.error(traceback.format_exc())
+        # Leave the classifiers as None to handle gracefully
+        model_state["status"] = "failed"
+        model_state["error"] = str(e)
+
+def warm_up_preloaded_models():
+    """Warm up models inherited from a prefork parent in this worker"""
+    model_state["status"] = "warming"
+    try:
+        warm_up([food_classifier, food_category_classifier])
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {str(e)}")
+    mark_ready()
+
+# Number of predictions requested from the food classifier; both the food
+# validation and the classification step read from the same top-k list.
+FOOD_CLASSIFIER_TOP_K = int(os.getenv("FOOD_CLASSIFIER_TOP_K", "5"))
+
+# Running totals used to report model inferences per scan request
+inference_stats = {"requests": 0, "inferences": 0}
+
+# Scans whose top food prediction is below this score are refined with the
+# category classifier. CATEGORY_MODE decides when that model runs:
+# "sequential" starts it only after the food classifier reports low
+# confidence; "speculative" starts both models at once and cancels or
+# discards the category result when confidence turns out to be high,
+# spending extra CPU to take one model latency off low-confidence scans.
+LOW_CONFIDENCE_THRESHOLD = float(os.getenv("LOW_CONFIDENCE_THRESHOLD", "0.7"))
+CATEGORY_MODES = ("sequential", "speculative")
+CATEGORY_MODE = os.getenv("CATEGORY_MODE", "sequential").lower()
+if CATEGORY_MODE not in CATEGORY_MODES:
+    raise ValueError(f"Unknown CATEGORY_MODE {CATEGORY_MODE!r}; expected one of {', '.join(CATEGORY_MODES)}")
+
+# Classification latency of single scans, split by outcome so the tail of
+# low-confidence (two-model) scans is visible on its own
+CLASSIFICATION_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+classification_seconds = {
+    "high_confidence": Histogram(CLASSIFICATION_BUCKETS),
+    "low_confidence": Histogram(CLASSIFICATION_BUCKETS),
+}
+speculation_stats = {"started": 0, "used": 0, "discarded": 0}
+
+def classify_food(image):
+    """Run the food classifier once and return its top-k predictions"""
+    return food_classifier(image, top_k=FOOD_CLASSIFIER_TOP_K)
+
+def classify_food_batch(images):
+    """Run the food classifier over a batch of images in one forward pass"""
+    return food_classifier(images, top_k=FOOD_CLASSIFIER_TOP_K, batch_size=len(images))
+
+def classify_category_batch(images):
+    """Run the category classifier over a batch of images in one forward pass"""
+    return food_category_classifier(images, batch_size=len(images))
+
+food_batcher = MicroBatcher(
+    classify_food_batch, inference_executor,
+    max_batch_size=INFERENCE_BATCH_SIZE, max_wait_ms=INFERENCE_BATCH_WAIT_MS, name="food"
+)
+category_batcher = MicroBatcher(
+    classify_category_batch, inference_executor,
+    max_batch_size=INFERENCE_BATCH_SIZE, max_wait_ms=INFERENCE_BATCH_WAIT_MS, name="category"
+)
+
+def check_image_dimensions(size):
+    """Cheap size/aspect checks on a ``(width, height)`` that don't need a model"""
+    width, height = size
+
+    if width < 50 or height < 50:
+        return False, "Image too small. Please upload a higher resolution image."
+
+    if width > 5000 or height > 5000:
+        return False, "Image too large. Please upload a smaller image."
+
+    # Check image aspect ratio (food images are usually not extremely wide/tall)
+    aspect_ratio = width / height
+    if aspect_ratio > 5 or aspect_ratio < 0.2:
+        return False, "Please upload a properly oriented food image."
+
+    return True, "Valid image dimensions"
+
+def validate_image_header(image_format, size):
+    """Reject an upload from its header, before the rest of it is read"""
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise InvalidUpload("Unsupported image format. Please upload a JPEG, PNG, GIF or WebP image.")
+    is_valid, message = check_image_dimensions(size)
+    if not is_valid:
+        raise InvalidUpload(message)
+
+def is_food_image(image, predictions=None):
+    """Validate if the uploaded image is likely to be food
+
+    ``predictions`` are the food classifier's top-k results for ``image``.
+    When they are supplied the classifier is not run again.
+    """
     try:
-        # Get image dimensions
-        width, height = image.size
-        
         # Basic validation checks
-        if width < 50 or height < 50:
-            return False, "Image too small. Please upload a higher resolution image."
-        
-        if width > 5000 or height > 5000:
-            return False, "Image too large. Please upload a smaller image."
-        
-        # Check image aspect ratio (food images are usually not extremely wide/tall)
-        aspect_ratio = width / height
-        if aspect_ratio > 5 or aspect_ratio < 0.2:
-            return False, "Please upload a properly oriented food image."
+        is_valid, message = check_image_dimensions(image.size)
+        if not is_valid:
+            return False, message
         
         # If we have AI models, use them for validation
         if food_classifier is not None:
             try:
                 # Get initial classification
-                results = food_classifier(image)
+                results = predictions if predictions is not None else classify_food(image)
                 top_result = results[0]
                 
-                # Check if the top result is food-related and has reasonable confidence
-                food_keywords = ['food', 'meal', 'dish', 'pizza', 'burger', 'salad', 'pasta', 
-                               'sandwich', 'soup', 'rice', 'chicken', 'beef', 'fish', 'vegetable',
-                               'fruit', 'bread', 'cake', 'cookie', 'drink', 'beverage']
-                
-                # Check if the label contains food-related keywords
-                label_lower = top_result["label"].lower()
-                is_food = any(keyword in label_lower for keyword in food_keywords)
+                # Food / non-food per label was worked out once at model load
+                is_food = food_label_table.is_food(top_result["label"])
                 
                 # Also check confidence - if it's very low, it might not be food
                 if top_result["score"] < 0.3:
                     return False, "This doesn't appear to be a clear food image. Please upload a better photo of food."
                 
                 if not is_food:
-                    return False, "This doesn't appear to be a food image. Please upload a clear photo of food."
+                    return False, NOT_FOOD_MESSAGE
                 
                 return True, "Valid food image"
                 
@@ -138,7 +625,7 @@ def is_food_image(image):
         is_food = random.random() < 0.80
         
         if not is_food:
-            return False, "This doesn't appear to be a food image. Please upload a clear photo of food."
+            return False, NOT_FOOD_MESSAGE
         
         return True, "Valid food image"
         
@@ -150,65 +637,474 @@ def is_food_image(image):
 async def root():
     return {"message": "Welcome to MealScan API", "status": "running"}
 
-@app.post("/api/scan")
-async def scan_food(file: UploadFile = File(...)):
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are loaded and warmed up"""
+    status_code = 200 if model_state["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=model_state)
+
+@app.get("/api/process/stats")
+async def get_process_stats():
+    """Report this worker's pid and memory (shared vs private pages)"""
+    return {"pid": os.getpid(), "memory": process_memory()}
+
+@app.get("/api/inference/stats")
+async def get_inference_stats():
+    """Report inference executor load and queue depth"""
+    return {
+        **inference_executor.stats(),
+        "scan_requests": inference_stats["requests"],
+        "scan_inferences": inference_stats["inferences"],
+        "batchers": {
+            "food": food_batcher.stats(),
+            "category": category_batcher.stats(),
+        },
+        "classification": classification_stats(),
+        "prefilter": prefilter_stats(),
+        "labels": food_label_table.stats(),
+        "preprocessing": imaging.stats(),
+        "uploads": upload_budget.stats(),
+    }
+
+def classification_stats():
+    latency = {}
+    for outcome, histogram in classification_seconds.items():
+        latency[outcome] = {
+            **histogram.snapshot(),
+            "p50": histogram.percentile(0.5),
+            "p95": histogram.percentile(0.95),
+            "p99": histogram.percentile(0.99),
+        }
+    return {
+        "category_mode": CATEGORY_MODE,
+        "low_confidence_threshold": LOW_CONFIDENCE_THRESHOLD,
+        "seconds": latency,
+        "speculative_category": speculation_stats,
+    }
+
+@app.get("/api/nutrition/stats")
+async def get_nutrition_stats():
+    """Report nutrition index and cache hit/miss counters"""
+    return {
+        "index": nutrition_index.stats(),
+        "database": nutrition_db.stats() if nutrition_db is not None else None,
+        "cache": nutrition_cache.stats(),
+        "circuit": off_breaker.stats(),
+    }
+
+@app.get("/api/scan/stats")
+async def get_scan_stats():
+    """Report scan result cache hit rate"""
+    return {"result_cache": scan_result_cache.stats()}
+
+MODEL_STATUSES = ("pending", "loading", "warming", "ready", "failed")
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request, model, nutrition and history metrics in the Prometheus text format"""
+    lines = []
+    lines += prometheus_histogram(
+        "mealscan_request_seconds", "End-to-end request latency", request_seconds.samples()
+    )
+    lines += prometheus_histogram(
+        "mealscan_stage_seconds", "Time spent in each stage of a request", stage_seconds.samples()
+    )
+    lines += prometheus_metric(
+        "mealscan_requests_total", "counter", "Requests by route, method and status", requests_total.samples()
+    )
+
+    lines += prometheus_metric(
+        "mealscan_model_status", "gauge", "1 for the current model loading status",
+        [({"status": status}, int(model_state["status"] == status)) for status in MODEL_STATUSES]
+    )
+    lines += prometheus_metric(
+        "mealscan_model_load_seconds", "gauge", "Time taken to load each model",
+        [({"model": model}, seconds) for model, seconds in model_state["load_seconds"].items()]
+    )
+    if model_state["ready_after_seconds"] is not None:
+        lines += prometheus_metric(
+            "mealscan_model_ready_after_seconds", "gauge", "Seconds from process start until the models were ready",
+            [({}, model_state["ready_after_seconds"])]
+        )
+    lines += prometheus_histogram(
+        "mealscan_classification_seconds", "Model time per scan by confidence",
+        [({"outcome": outcome}, histogram) for outcome, histogram in classification_seconds.items()]
+    )
+    lines += prometheus_histogram(
+        "mealscan_batch_queue_wait_seconds", "Time images waited for a micro-batch",
+        [({"model": name}, batcher.queue_wait) for name, batcher in (("food", food_batcher), ("category", category_batcher))]
+    )
+    executor = inference_executor.stats()
+    lines += prometheus_metric(
+        "mealscan_inference_queue_depth", "gauge", "Inference jobs waiting for a worker", [({}, executor["queue_depth"])]
+    )
+    lines += prometheus_metric(
+        "mealscan_inference_rejected_total", "counter", "Inference jobs shed because the queue was full",
+        [({}, executor["rejected"])]
+    )
+    lines += prometheus_metric(
+        "mealscan_upload_in_flight_bytes", "gauge", "Upload bytes held in memory", [({}, upload_budget.in_flight)]
+    )
+
+    lines += prometheus_metric(
+        "mealscan_not_food_rejections_total", "counter", "Scans refused as not food, by the stage that refused them",
+        not_food_rejections.samples()
+    )
+    lines += prometheus_metric(
+        "mealscan_prefilter_shadow_total", "counter",
+        "Images the prefilter would reject in shadow mode, by the food classifier's decision",
+        prefilter_shadow.samples()
+    )
+
+    lines += prometheus_metric(
+        "mealscan_off_lookups_total", "counter", "Open Food Facts lookups by outcome", off_lookups.samples()
+    )
+    lines += prometheus_histogram(
+        "mealscan_off_lookup_seconds", "Open Food Facts lookup latency", [({}, off_lookup_seconds)]
+    )
+    lines += prometheus_metric(
+        "mealscan_off_circuit_state", "gauge", "1 for the current Open Food Facts circuit breaker state",
+        [({"state": state}, int(off_breaker.state == state)) for state in CIRCUIT_STATES]
+    )
+    lines += prometheus_metric(
+        "mealscan_off_circuit_opened_total", "counter", "Times the Open Food Facts circuit breaker opened",
+        [({}, off_breaker.opened)]
+    )
+    lines += prometheus_metric(
+        "mealscan_nutrition_cache_total", "counter", "Nutrition cache events",
+        [({"event": event}, count) for event, count in nutrition_cache.stats_counters.items()]
+    )
+
+    lines += prometheus_metric(
+        "mealscan_db_fallbacks_total", "counter", "Operations answered or skipped because MongoDB is not available",
+        db_fallbacks.samples()
+    )
+    if history_writer is not None:
+        history = history_writer.stats()
+        lines += prometheus_metric(
+            "mealscan_history_queue_depth", "gauge", "Scan records waiting to be written", [({}, history["queue_depth"])]
+        )
+        lines += prometheus_metric(
+            "mealscan_history_records_total", "counter", "Scan history records by what happened to them",
+            [({"outcome": outcome}, history[outcome])
+             for outcome in ("submitted", "written", "spilled", "overflowed", "replayed")]
+        )
+        lines += prometheus_metric(
+            "mealscan_history_retries_total", "counter", "History batch inserts retried", [({}, history["retries"])]
+        )
+        lines += prometheus_histogram(
+            "mealscan_history_flush_seconds", "History batch insert latency", [({}, history_writer.flush_seconds)]
+        )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+def build_scan_record(food_item, nutrition_data, confidence, image_url=None):
+    return {
+        "timestamp": datetime.utcnow(),
+        "food_item": food_item,
+        "nutrition_data": nutrition_data,
+        "confidence": float(confidence),
+        "image_url": image_url
+    }
+
+def thumbnail_url(digest):
+    return f"/api/thumbnails/{digest}"
+
+def queue_thumbnail(digest, image):
+    """Queue a thumbnail of a scanned image; returns its URL, or None if there won't be one"""
+    if history_writer is None or thumbnail_writer is None or not thumbnail_writer.submit(digest, image):
+        return None
+    return thumbnail_url(digest)
+
+def known_thumbnail(digest):
+    """URL of a thumbnail already queued or stored for an upload, else None"""
+    if thumbnail_writer is None or not thumbnail_writer.has(digest):
+        return None
+    return thumbnail_url(digest)
+
+async def store_scan_record(food_item, nutrition_data, confidence, image_url=None):
+    """Queue a scan for the history writer; never waits for MongoDB"""
+    if history_writer is not None:
+        history_writer.submit(build_scan_record(food_item, nutrition_data, confidence, image_url))
+    else:
+        db_fallbacks.inc(operation="history_write")
+        logger.warning("Database not available - skipping scan history storage")
+
+async def store_scan_records(scan_records):
+    """Queue several scans for the history writer"""
+    if not scan_records:
+        return
+    if history_writer is not None:
+        for scan_record in scan_records:
+            history_writer.submit(scan_record)
+    else:
+        db_fallbacks.inc(len(scan_records), operation="history_write")
+        logger.warning("Database not available - skipping scan history storage")
+
+async def respond_from_cache(response, cached, cache_status, image_url=None):
+    """Answer a scan from the result cache, still recording it in history"""
+    scan_result_cache.record(cache_status)
+    response.headers["X-Scan-Cache"] = cache_status
+    response.headers["X-Inference-Count"] = "0"
+    logger.info(f"Scan result cache {cache_status}: {cached['food_item']}")
+    await store_scan_record(cached["food_item"], cached["nutrition_data"], cached["confidence"], image_url)
+    return cached
+
+def check_models_available():
+    if food_classifier is None:
+        if model_state["status"] in ("pending", "loading"):
+            raise HTTPException(
+                status_code=503,
+                detail="AI models are still loading. Please try again shortly.",
+                headers={"Retry-After": str(INFERENCE_RETRY_AFTER)}
+            )
+        raise HTTPException(status_code=503, detail="AI models are not available. Please check server configuration.")
+
+async def read_scan_upload(file):
+    """Read one upload within the size limits; the header is checked as soon as it arrives
+
+    The caller must release ``len(result)`` bytes from ``upload_budget``.
+    """
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
     try:
-        logger.info(f"Received file: {file.filename}, content_type: {file.content_type}")
-        
-        # Check if models are loaded
-        if food_classifier is None:
-            raise HTTPException(status_code=503, detail="AI models are not available. Please check server configuration.")
-        
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+        with stage("read"):
+            return await read_upload(
+                file, MAX_UPLOAD_BYTES, upload_budget,
+                validate_header=validate_image_header, chunk_size=UPLOAD_CHUNK_SIZE
+            )
+    except InvalidUpload as e:
+        logger.warning(f"Upload rejected from header: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=upload_too_large_message())
+    except UploadBudgetExceeded as e:
+        logger.warning(f"Shedding scan upload: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy receiving other images. Please try again shortly.",
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)}
+        )
 
-        # Read and process the image
-        contents = await file.read()
+async def decode_scan_image(contents):
+    """Validate and decode an upload, then release its upload budget"""
+    try:
         try:
-            image = Image.open(io.BytesIO(contents))
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            logger.info(f"Successfully opened image, size: {image.size}")
+            # Only the header is parsed here; no pixels are decoded yet
+            image = imaging.open_image(contents)
+            logger.info(f"Successfully opened image, format: {image.format}, size: {image.size}")
         except Exception as e:
             logger.error(f"Error opening image: {str(e)}")
             raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Validate if the image is food-related
-        logger.info("Validating if image contains food")
-        is_food, validation_message = is_food_image(image)
-        if not is_food:
-            logger.warning(f"Food validation failed: {validation_message}")
+
+        # Reject images with unusable dimensions before decoding or inference
+        is_valid, validation_message = check_image_dimensions(image.size)
+        if not is_valid:
+            logger.warning(f"Image validation failed: {validation_message}")
             raise HTTPException(status_code=400, detail=validation_message)
-            
-        # First classification attempt with nateraw/food
-        logger.info("Attempting food classification")
+
         try:
-            results = food_classifier(image)
-            food_item = results[0]["label"]
-            confidence = results[0]["score"]
-            logger.info(f"Initial classification: {food_item} (confidence: {confidence})")
+            with stage("decode"):
+                image, timings = await asyncio.to_thread(imaging.decode_image, image, IMAGE_DECODE_SIZE)
+            logger.info(
+                f"Decoded image to {image.size} "
+                f"(decode: {timings['decode'] * 1000:.1f}ms, resize: {timings['resize'] * 1000:.1f}ms)"
+            )
         except Exception as e:
-            logger.error(f"Error in food classification: {str(e)}")
-            logger.error(traceback.format_exc())
-            raise HTTPException(status_code=500, detail="Error in food classification")
+            logger.error(f"Error decoding image: {str(e)}")
+            raise HTTPException(status_code=400, detail="Invalid image file")
+        return image
+    finally:
+        # The raw upload isn't needed once decoded
+        upload_budget.release(len(contents))
+
+def prefilter_stats():
+    if food_prefilter is None:
+        return {"enabled": False, "mode": PREFILTER_MODE}
+    stats = food_prefilter.stats()
+    # Every enforced rejection is one food classifier run avoided; price it
+    # at the mean latency of confident scans, which run that model only
+    runs_saved = not_food_rejections.value(source="prefilter")
+    food_only = classification_seconds["high_confidence"]
+    mean_seconds = food_only.sum / food_only.count if food_only.count else None
+    return {
+        "enabled": True,
+        "mode": PREFILTER_MODE,
+        **stats,
+        "shadow": {
+            "classifier_rejected": prefilter_shadow.value(classifier="rejected"),
+            "classifier_accepted": prefilter_shadow.value(classifier="accepted"),
+        },
+        "classifier_runs_saved": runs_saved,
+        "estimated_seconds_saved": runs_saved * mean_seconds if mean_seconds is not None else None,
+    }
+
+def prefilter_rejection(image):
+    """Run the cheap food/non-food gate
+
+    Returns ``(error, flagged)``: the 400 error if ``image`` fails the gate
+    in enforce mode, and whether it failed in shadow mode, for
+    ``record_food_validation`` to compare with the classifier.
+    """
+    if food_prefilter is None:
+        return None, False
+    with stage("prefilter"):
+        passed, features = food_prefilter.check(image)
+    if passed:
+        return None, False
+    action = "rejected" if PREFILTER_MODE == "enforce" else "would reject (shadow)"
+    logger.warning(
+        f"Prefilter {action} image by {features['rejected_by']}: saturation={features['saturation']:.3f}, "
+        f"uniform_fraction={features['uniform_fraction']:.3f}, detail={features['detail']:.3f}"
+    )
+    if PREFILTER_MODE != "enforce":
+        return None, True
+    not_food_rejections.inc(source="prefilter")
+    return HTTPException(status_code=400, detail=NOT_FOOD_MESSAGE), False
+
+def record_food_validation(is_food, prefilter_flagged):
+    """Count a classifier food/non-food decision, and how it compares with a shadow prefilter failure"""
+    if not is_food:
+        not_food_rejections.inc(source="classifier")
+    if prefilter_flagged:
+        prefilter_shadow.inc(classifier="accepted" if is_food else "rejected")
+
+def discard_category_task(task):
+    """Drop a speculative category run whose result is no longer needed
+
+    A run still waiting for its micro-batch is skipped entirely; one
+    already on the executor finishes and its result is ignored.
+    """
+    if task is None:
+        return
+    speculation_stats["discarded"] += 1
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        # Retrieve any exception so asyncio doesn't log it as unhandled
+        task.exception()
+
+def inference_queue_full_error(e):
+    logger.warning(f"Shedding scan request: {str(e)}")
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy analysing other images. Please try again shortly.",
+        headers={"Retry-After": str(INFERENCE_RETRY_AFTER)}
+    )
+
+@app.post("/api/scan")
+async def scan_food(response: Response, file: UploadFile = File(...)):
+    deadline = time.perf_counter() + SCAN_DEADLINE
+    try:
+        logger.info(f"Received file: {file.filename}, content_type: {file.content_type}")
         
-        # If confidence is low, try the category classifier
-        if confidence < 0.7 and food_category_classifier is not None:
-            logger.info("Low confidence, trying category classifier")
+        # Check if models are loaded
+        check_models_available()
+
+        # Read the upload in chunks; the header is checked as soon as it arrives
+        contents = await read_scan_upload(file)
+
+        # A byte-identical upload (retry, double tap) reuses the earlier result
+        with stage("cache"):
+            content_hash = hashlib.sha256(contents).hexdigest()
+            cached = scan_result_cache.get(content_hash)
+        if cached is not None:
+            upload_budget.release(len(contents))
+            return await respond_from_cache(response, cached, "HIT", known_thumbnail(content_hash))
+
+        image = await decode_scan_image(contents)
+
+        perceptual_hash = None
+        if SCAN_CACHE_PERCEPTUAL:
+            with stage("cache"):
+                perceptual_hash = imaging.perceptual_hash(image)
+                cached = scan_result_cache.get_similar(perceptual_hash, SCAN_CACHE_PERCEPTUAL_DISTANCE)
+            if cached is not None:
+                scan_result_cache.put(content_hash, cached, perceptual_hash)
+                return await respond_from_cache(
+                    response, cached, "HIT-PERCEPTUAL", queue_thumbnail(content_hash, image)
+                )
+        scan_result_cache.record("MISS")
+        response.headers["X-Scan-Cache"] = "MISS"
+
+        # Obvious non-food never reaches the models
+        rejection, prefilter_flagged = prefilter_rejection(image)
+        if rejection is not None:
+            raise rejection
+
+        # Run nateraw/food once; validation and classification share the result
+        logger.info("Attempting food classification")
+        inference_count = 0
+        classification_started = time.perf_counter()
+        category_task = None
+        if CATEGORY_MODE == "speculative" and food_category_classifier is not None:
+            category_task = asyncio.create_task(category_batcher.submit(image))
+            speculation_stats["started"] += 1
+        try:
             try:
-                category_results = food_category_classifier(image)
-                food_category = category_results[0]["label"]
-                food_item = f"{food_item} ({food_category})"
-                logger.info(f"Refined classification: {food_item}")
+                with stage("food_model"):
+                    predictions = await food_batcher.submit(image)
+                inference_count += 1
+            except InferenceQueueFull:
+                raise
             except Exception as e:
-                logger.error(f"Error in category classification: {str(e)}")
-                # Continue even if category classification fails
+                logger.error(f"Error in food classification: {str(e)}")
+                logger.error(traceback.format_exc())
+                raise HTTPException(status_code=500, detail="Error in food classification")
+
+            # Validate if the image is food-related
+            logger.info("Validating if image contains food")
+            with stage("validate"):
+                is_food, validation_message = is_food_image(image, predictions)
+            record_food_validation(is_food, prefilter_flagged)
+            if not is_food:
+                logger.warning(f"Food validation failed: {validation_message}")
+                raise HTTPException(status_code=400, detail=validation_message)
+
+            food_item = predictions[0]["label"]
+            confidence = predictions[0]["score"]
+            logger.info(f"Initial classification: {food_item} (confidence: {confidence})")
+
+            # If confidence is low, try the category classifier
+            low_confidence = confidence < LOW_CONFIDENCE_THRESHOLD and food_category_classifier is not None
+            if low_confidence:
+                logger.info("Low confidence, trying category classifier")
+                try:
+                    with stage("category_model"):
+                        if category_task is not None:
+                            speculative, category_task = category_task, None
+                            category_results = await speculative
+                            speculation_stats["used"] += 1
+                        else:
+                            category_results = await category_batcher.submit(image)
+                    inference_count += 1
+                    food_category = category_results[0]["label"]
+                    food_item = f"{food_item} ({food_category})"
+                    logger.info(f"Refined classification: {food_item}")
+                except Exception as e:
+                    logger.error(f"Error in category classification: {str(e)}")
+                    # Continue even if category classification fails
+        finally:
+            discard_category_task(category_task)
+
+        outcome = "low_confidence" if low_confidence else "high_confidence"
+        classification_seconds[outcome].observe(time.perf_counter() - classification_started)
+
+        inference_stats["requests"] += 1
+        inference_stats["inferences"] += inference_count
+        response.headers["X-Inference-Count"] = str(inference_count)
+        logger.info(f"Model inferences for this scan: {inference_count}")
         
         # Query Open Food Facts API
         logger.info("Fetching nutritional data")
-        nutrition_data = await get_nutrition_data(food_item)
+        with stage("nutrition"):
+            degraded, nutrition_data = await get_nutrition_data(food_item, deadline)
         
         if not nutrition_data:
             logger.warning(f"No nutritional data found for {food_item}")
@@ -220,138 +1116,302 @@ async def scan_food(file: UploadFile = File(...)):
                 "serving_size": "100g"
             }
         
-        # Store scan history
-        if db is not None:
-            try:
-                scan_record = {
-                    "timestamp": datetime.utcnow(),
-                    "food_item": food_item,
-                    "nutrition_data": nutrition_data,
-                    "confidence": float(confidence),
-                    "image_url": None
-                }
-                await db.scan_history.insert_one(scan_record)
-                logger.info("Successfully stored scan record")
-            except Exception as e:
-                logger.error(f"Error storing scan record: {str(e)}")
-                # Continue even if storage fails
-        else:
-            logger.warning("Database not available - skipping scan history storage")
-        
-        return {
+        with stage("history"):
+            await store_scan_record(food_item, nutrition_data, confidence, queue_thumbnail(content_hash, image))
+
+        result = {
             "food_item": food_item,
             "confidence": float(confidence),
             "nutrition_data": nutrition_data
         }
+        # A fallback answer is only good for this scan; the next one should retry
+        if not degraded:
+            scan_result_cache.put(content_hash, result, perceptual_hash)
+        return result
             
     except HTTPException as he:
         raise he
+    except InferenceQueueFull as e:
+        raise inference_queue_full_error(e)
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
-async def get_nutrition_data(food_item: str):
-    """Query Open Food Facts API for nutritional information"""
+@app.post("/api/scan/batch")
+async def scan_food_batch(files: List[UploadFile] = File(...)):
+    """Scan several images in one request, streaming one NDJSON line per image
+
+    Uploads are decoded in parallel and classified in one batched forward
+    pass per model. Nutrition lookups are shared between images with the
+    same food item, lines are sent as each lookup finishes, and history is
+    written with a single insert_many at the end.
+    """
+    deadline = time.perf_counter() + SCAN_DEADLINE
+    check_models_available()
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many images. Please upload at most {MAX_BATCH_FILES} at once.")
+    logger.info(f"Received batch of {len(files)} files")
+
+    # Per-image failures become error lines instead of failing the whole batch
+    results = [{"index": index, "filename": file.filename} for index, file in enumerate(files)]
+
+    def fail(index, error):
+        results[index].update({"error": error.detail, "status_code": error.status_code})
+
+    async def prepare(index, file):
+        try:
+            contents = await read_scan_upload(file)
+            image = await decode_scan_image(contents)
+            rejection, flagged = prefilter_rejection(image)
+            if rejection is not None:
+                raise rejection
+            if flagged:
+                prefilter_flagged.add(index)
+            return contents, image
+        except HTTPException as e:
+            fail(index, e)
+            return None, None
+
+    # Images that failed the prefilter in shadow mode
+    prefilter_flagged = set()
+
+    prepared = await asyncio.gather(*(prepare(index, file) for index, file in enumerate(files)))
+    decoded = [(index, image) for index, (_, image) in enumerate(prepared) if image is not None]
+    content_hashes = {
+        index: hashlib.sha256(contents).hexdigest()
+        for index, (contents, image) in enumerate(prepared) if image is not None
+    }
+    del prepared
+
+    # One forward pass per model for the whole batch
+    classified = {}
+    inference_count = 0
     try:
-        # Search for the food item using the public API
-        search_url = "https://world.openfoodfacts.org/cgi/search.pl"
-        params = {
-            "search_terms": food_item,
-            "search_simple": 1,
-            "action": "process",
-            "json": 1,
-            "page_size": 1
-        }
-        response = requests.get(search_url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get("products") and len(data["products"]) > 0:
-            product = data["products"][0]
-            nutriments = product.get("nutriments", {})
-            
-            # Get nutritional values with proper type conversion
-            try:
-                calories = float(nutriments.get("energy-kcal_100g", 0))
-            except (ValueError, TypeError):
-                try:
-                    # Try alternative energy field
-                    calories = float(nutriments.get("energy_100g", 0)) / 4.184  # Convert kJ to kcal
-                except (ValueError, TypeError):
-                    calories = 0
-                    
-            try:
-                proteins = float(nutriments.get("proteins_100g", 0))
-            except (ValueError, TypeError):
-                proteins = 0
-                
-            try:
-                fats = float(nutriments.get("fat_100g", 0))
-            except (ValueError, TypeError):
-                fats = 0
-                
+        if decoded:
+            with stage("food_model"):
+                all_predictions = await inference_executor.run(classify_food_batch, [image for _, image in decoded])
+            inference_count += 1
+            for (index, image), predictions in zip(decoded, all_predictions):
+                with stage("validate"):
+                    is_food, validation_message = is_food_image(image, predictions)
+                record_food_validation(is_food, index in prefilter_flagged)
+                if not is_food:
+                    fail(index, HTTPException(status_code=400, detail=validation_message))
+                    continue
+                classified[index] = (predictions[0]["label"], predictions[0]["score"])
+
+        low_confidence = [
+            (index, image) for index, image in decoded
+            if index in classified and classified[index][1] < LOW_CONFIDENCE_THRESHOLD
+        ]
+        if low_confidence and food_category_classifier is not None:
             try:
-                carbs = float(nutriments.get("carbohydrates_100g", 0))
-            except (ValueError, TypeError):
-                carbs = 0
-            
-            return {
-                "calories": round(calories, 1),
-                "proteins": round(proteins, 1),
-                "fats": round(fats, 1),
-                "carbs": round(carbs, 1),
-                "serving_size": "100g"
-            }
-            
-        # If no product found, try searching by category
-        category_url = "https://world.openfoodfacts.org/category/{}/1.json".format(food_item.lower().replace(" ", "-"))
-        response = requests.get(category_url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("products") and len(data["products"]) > 0:
-                product = data["products"][0]
-                nutriments = product.get("nutriments", {})
-                
-                return {
-                    "calories": round(float(nutriments.get("energy-kcal_100g", 0)), 1),
-                    "proteins": round(float(nutriments.get("proteins_100g", 0)), 1),
-                    "fats": round(float(nutriments.get("fat_100g", 0)), 1),
-                    "carbs": round(float(nutriments.get("carbohydrates_100g", 0)), 1),
-                    "serving_size": "100g"
+                with stage("category_model"):
+                    category_results = await inference_executor.run(
+                        classify_category_batch, [image for _, image in low_confidence]
+                    )
+                inference_count += 1
+                for (index, _), categories in zip(low_confidence, category_results):
+                    food_item, confidence = classified[index]
+                    classified[index] = (f"{food_item} ({categories[0]['label']})", confidence)
+            except Exception as e:
+                logger.error(f"Error in batch category classification: {str(e)}")
+                # Continue even if category classification fails
+    except InferenceQueueFull as e:
+        raise inference_queue_full_error(e)
+    except Exception as e:
+        logger.error(f"Error in batch food classification: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Error in food classification")
+
+    inference_stats["requests"] += 1
+    inference_stats["inferences"] += inference_count
+
+    # Thumbnails for the history records of the images that were classified
+    image_urls = {
+        index: queue_thumbnail(content_hashes[index], image) for index, image in decoded if index in classified
+    }
+
+    # Each distinct food item is looked up once, however many images share it
+    indexes_by_item = {}
+    for index, (food_item, _) in classified.items():
+        indexes_by_item.setdefault(food_item, []).append(index)
+
+    async def lookup(food_item):
+        return (food_item, *await get_nutrition_data(food_item, deadline))
+
+    async def stream():
+        for result in results:
+            if "error" in result:
+                yield json.dumps(result) + "\n"
+
+        scan_records = []
+        for finished in asyncio.as_completed([lookup(food_item) for food_item in indexes_by_item]):
+            food_item, degraded, nutrition_data = await finished
+            for index in indexes_by_item[food_item]:
+                confidence = classified[index][1]
+                result = {
+                    "food_item": food_item,
+                    "confidence": float(confidence),
+                    "nutrition_data": nutrition_data
                 }
-        
-        # If still no data found, return default values
-        logger.warning(f"No nutritional data found for {food_item}")
-        return {
-            "calories": 0.0,
-            "proteins": 0.0,
-            "fats": 0.0,
-            "carbs": 0.0,
-            "serving_size": "100g"
-        }
-        
+                if not degraded:
+                    scan_result_cache.put(content_hashes[index], result)
+                scan_records.append(build_scan_record(food_item, nutrition_data, confidence, image_urls[index]))
+                yield json.dumps({**results[index], **result}) + "\n"
+
+        await store_scan_records(scan_records)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def lookup_off_nutrition(food_item):
+    """``off_client.lookup`` behind the circuit breaker, counted by outcome
+
+    Also used for background cache refreshes.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        nutrition_data = await off_breaker.call(off_client.lookup, food_item)
+        outcome = "found" if nutrition_data is not None else "not_found"
+        return nutrition_data
+    except CircuitOpenError:
+        outcome = "circuit_open"
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        if outcome != "circuit_open":
+            off_lookup_seconds.observe(time.perf_counter() - started)
+        off_lookups.inc(outcome=outcome)
+
+async def fallback_nutrition(food_item):
+    """``(True, nutrition)`` when no fresh lookup is possible: the last cached answer, else defaults"""
+    found, nutrition_data = await nutrition_cache.last_known(food_item)
+    if found and nutrition_data is not None:
+        return True, nutrition_data
+    return True, default_nutrition()
+
+async def get_nutrition_data(food_item: str, deadline=None):
+    """Query Open Food Facts API for nutritional information
+
+    Returns ``(degraded, nutrition)``. ``deadline`` is the
+    ``time.perf_counter()`` value by which the caller needs an answer;
+    past it, or when the lookup fails, the last cached or default values
+    are returned and ``degraded`` is True, so callers don't keep them.
+    """
+    found, nutrition_data = nutrition_index.lookup(food_item)
+    if found:
+        if nutrition_data is None:
+            logger.warning(f"No nutritional data found for {food_item}")
+            return False, default_nutrition()
+        return False, dict(nutrition_data)
+
+    if nutrition_db is not None:
+        try:
+            nutrition_data = await asyncio.to_thread(nutrition_db.lookup, food_item)
+        except Exception as e:
+            logger.error(f"Error searching the local nutrition database: {str(e)}")
+        else:
+            # The dump holds every Open Food Facts product, so no match here
+            # means the live search would not find one either
+            if nutrition_data is None:
+                logger.warning(f"No nutritional data found for {food_item}")
+                return False, default_nutrition()
+            return False, nutrition_data
+
+    budget = deadline - time.perf_counter() if deadline is not None else None
+    if budget is not None and budget <= 0:
+        logger.warning(f"No time left in the scan deadline to look up nutrition for {food_item}")
+        return await fallback_nutrition(food_item)
+
+    try:
+        # An abandoned lookup keeps running in the cache's single flight and
+        # is stored for the next scan of the same food
+        nutrition_data = await asyncio.wait_for(nutrition_cache.get(food_item, lookup_off_nutrition), budget)
+    except asyncio.TimeoutError:
+        limit = off_client.deadline if budget is None else min(budget, off_client.deadline)
+        logger.error(f"Nutrition lookup for {food_item} exceeded its {limit:.2f}s deadline")
+        return await fallback_nutrition(food_item)
+    except CircuitOpenError as e:
+        logger.warning(f"Skipping nutrition lookup for {food_item}: {str(e)}")
+        return await fallback_nutrition(food_item)
     except Exception as e:
         logger.error(f"Error fetching nutrition data: {str(e)}")
         logger.error(traceback.format_exc())
-        return {
-            "calories": 0.0,
-            "proteins": 0.0,
-            "fats": 0.0,
-            "carbs": 0.0,
-            "serving_size": "100g"
-        }
+        return await fallback_nutrition(food_item)
+
+    if nutrition_data is None:
+        # If still no data found, return default values
+        logger.warning(f"No nutritional data found for {food_item}")
+        return False, default_nutrition()
+    return False, nutrition_data
+
+@app.get("/api/history/stats")
+async def get_history_stats():
+    """Report history writer queue depth, flush latency and spill counters"""
+    if history_writer is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        **history_writer.stats(),
+        "rollups": rollup_writer.stats(),
+        "thumbnails": thumbnail_writer.stats() if thumbnail_writer is not None else None,
+    }
+
+@app.get("/api/thumbnails/{digest}")
+async def get_thumbnail(digest: str, request: Request):
+    """Stream a scan thumbnail; its URL never changes content, so it is cached forever
+
+    A thumbnail that could not be stored is a 404 (see ThumbnailWriter).
+    """
+    if thumbnail_store is None or not DIGEST_PATTERN.fullmatch(digest):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        thumbnail = await thumbnail_store.open(digest)
+    except Exception as e:
+        logger.error(f"Error reading thumbnail {digest}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error reading thumbnail")
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    headers["Content-Length"] = str(thumbnail.length)
+    return StreamingResponse(thumbnail.chunks, media_type=thumbnail.content_type, headers=headers)
 
 @app.get("/api/history")
-async def get_scan_history(limit: int = 10):
-    """Retrieve recent scan history"""
+async def get_scan_history(response: Response, limit: int = 10, before: Optional[str] = None,
+                           fields: Optional[str] = None):
+    """Retrieve recent scan history, newest first
+
+    Pages are keyset-paginated: pass the ``X-Next-Cursor`` header of one
+    page as ``before`` to get the next. ``fields`` is a comma-separated
+    subset of the record fields to return. ``limit`` is capped at
+    HISTORY_MAX_LIMIT.
+    """
     if db is None:
+        db_fallbacks.inc(operation="history_read")
         logger.warning("Database not available - returning empty history")
         return []
-    
+
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    try:
+        query = history_filter(before)
+        projection = history_projection(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        cursor = db.scan_history.find().sort("timestamp", -1).limit(limit)
-        history = await cursor.to_list(length=limit)
+        # One extra record tells whether another page follows
+        cursor = db.scan_history.find(query, projection).sort(HISTORY_SORT).limit(limit + 1)
+        history = await cursor.to_list(length=limit + 1)
+        if len(history) > limit:
+            history = history[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(history[-1])
         # Convert ObjectId to string for JSON serialization
         for record in history:
             record["_id"] = str(record["_id"])
@@ -361,6 +1421,52 @@ async def get_scan_history(limit: int = 10):
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} date {value!r}; expected YYYY-MM-DD")
+
+def analytics_range(start, end, default_days):
+    """Resolve ``start``/``end`` query values to dates, capped at ANALYTICS_MAX_DAYS"""
+    end_day = parse_day(end, "end") if end else datetime.utcnow().date()
+    start_day = parse_day(start, "start") if start else end_day - timedelta(days=default_days - 1)
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end_day - start_day).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {ANALYTICS_MAX_DAYS} days")
+    return start_day, end_day
+
+@app.get("/api/analytics/daily")
+async def get_daily_analytics(start: Optional[str] = None, end: Optional[str] = None):
+    """Scans and calorie/macro totals per UTC day (default: the last 7 days)"""
+    start_day, end_day = analytics_range(start, end, 7)
+    if db is None:
+        db_fallbacks.inc(operation="analytics")
+        return []
+    return await daily_totals(db, start_day, end_day)
+
+@app.get("/api/analytics/weekly")
+async def get_weekly_analytics(weeks: int = 4):
+    """Scans and calorie/macro totals per ISO week, oldest first"""
+    weeks = max(1, min(weeks, ANALYTICS_MAX_DAYS // 7))
+    if db is None:
+        db_fallbacks.inc(operation="analytics")
+        return []
+    return await weekly_totals(db, weeks)
+
+@app.get("/api/analytics/top-foods")
+async def get_top_foods(limit: int = 10, start: Optional[str] = None, end: Optional[str] = None):
+    """Most scanned food items, all time or between ``start`` and ``end``"""
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    if db is None:
+        db_fallbacks.inc(operation="analytics")
+        return []
+    if start is None and end is None:
+        return await top_foods(db, limit)
+    start_day, end_day = analytics_range(start, end, 30)
+    return await top_foods(db, limit, start_day, end_day)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -9,6 +9,8 @@ import io
 import logging
 import traceback
 
+from labels import build_label_table, load_label_config
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,19 +31,30 @@ app.add_middleware(
 )
 
 # Simple mock food classifier with validation
+MOCK_FOODS = [
+    {"label": "pizza", "score": 0.85},
+    {"label": "burger", "score": 0.78},
+    {"label": "salad", "score": 0.72},
+    {"label": "pasta", "score": 0.68},
+    {"label": "sandwich", "score": 0.75}
+]
+MOCK_NON_FOOD = {"label": "table", "score": 0.81}
+
+# Same label table as main.py, built once over the mock labels
+label_table = build_label_table(
+    [result["label"] for result in MOCK_FOODS] + [MOCK_NON_FOOD["label"]],
+    load_label_config(os.getenv("LABEL_TABLE_PATH", "label_table.json"))
+)
+
 def mock_food_classifier(image):
     """Mock food classifier that returns random results for testing"""
-    mock_foods = [
-        {"label": "pizza", "score": 0.85},
-        {"label": "burger", "score": 0.78},
-        {"label": "salad", "score": 0.72},
-        {"label": "pasta", "score": 0.68},
-        {"label": "sandwich", "score": 0.75}
-    ]
     import random
-    return [random.choice(mock_foods)]
+    # Simulate 85% chance of being food (for testing purposes)
+    if random.random() >= 0.85:
+        return [MOCK_NON_FOOD]
+    return [random.choice(MOCK_FOODS)]
 
-def is_food_image(image):
+def is_food_image(image, predictions):
     """Validate if the uploaded image is likely to be food"""
     try:
         # Get image dimensions
@@ -59,14 +72,8 @@ def is_food_image(image):
         if aspect_ratio > 5 or aspect_ratio < 0.2:
             return False, "Please upload a properly oriented food image."
         
-        # Mock food validation - in real implementation, this would use AI
-        # For now, we'll simulate some validation based on image characteristics
-        import random
-        
-        # Simulate 85% chance of being food (for testing purposes)
-        is_food = random.random() < 0.85
-        
-        if not is_food:
+        # Food / non-food of the mock prediction comes from the label table
+        if not label_table.is_food(predictions[0]["label"]):
             return False, "This doesn't appear to be a food image. Please upload a clear photo of food."
         
         return True, "Valid food image"
@@ -100,24 +107,25 @@ async def scan_food(file: UploadFile = File(...)):
             logger.error(f"Error opening image: {str(e)}")
             raise HTTPException(status_code=400, detail="Invalid image file")
         
-        # Validate if the image is food-related
-        logger.info("Validating if image contains food")
-        is_food, validation_message = is_food_image(image)
-        if not is_food:
-            logger.warning(f"Food validation failed: {validation_message}")
-            raise HTTPException(status_code=400, detail=validation_message)
-            
         # Mock food classification
         logger.info("Attempting food classification (mock)")
         try:
             results = mock_food_classifier(image)
-            food_item = results[0]["label"]
-            confidence = results[0]["score"]
-            logger.info(f"Mock classification: {food_item} (confidence: {confidence})")
         except Exception as e:
             logger.error(f"Error in food classification: {str(e)}")
             logger.error(traceback.format_exc())
             raise HTTPException(status_code=500, detail="Error in food classification")
+
+        # Validate if the image is food-related
+        logger.info("Validating if image contains food")
+        is_food, validation_message = is_food_image(image, results)
+        if not is_food:
+            logger.warning(f"Food validation failed: {validation_message}")
+            raise HTTPException(status_code=400, detail=validation_message)
+
+        food_item = results[0]["label"]
+        confidence = results[0]["score"]
+        logger.info(f"Mock classification: {food_item} (confidence: {confidence})")
         
         # Query Open Food Facts API
         logger.info("Fetching nutritional data")
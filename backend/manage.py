@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+MealScan maintenance commands
+
+Run from the backend directory, e.g.:
+    python manage.py build-nutrition-index
+    python manage.py ingest-off-dump openfoodfacts-products.jsonl.gz
+    python manage.py download-models
+    python manage.py export-model --backend onnx
+    python manage.py check-parity --backend onnx --images samples/
+    python manage.py backfill-rollups
+    python manage.py serve --workers 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+FOOD_MODEL = "nateraw/food"
+CATEGORY_MODEL = "Kaludi/food-category-classification-v2.0"
+DEFAULT_NUTRITION_INDEX_PATH = "nutrition_index.json"
+DEFAULT_NUTRITION_DB_PATH = "off_nutrition.db"
+
+
+def model_labels(model_name):
+    """Return the class labels of a Hugging Face model from its config only"""
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_name, token=os.getenv("HUGGINGFACE_API_KEY"))
+    return [config.id2label[index] for index in sorted(config.id2label)]
+
+
+def build_nutrition_index_command(args):
+    """Look up nutrition for every classifier label and write the index"""
+    from nutrition import OpenFoodFactsClient
+    from nutrition_index import build_nutrition_index, write_nutrition_index
+
+    labels = model_labels(FOOD_MODEL)
+    if args.with_categories:
+        categories = model_labels(CATEGORY_MODEL)
+        labels += [f"{label} ({category})" for label in labels for category in categories]
+    print(f"Resolving nutrition for {len(labels)} labels...")
+
+    async def run():
+        client = OpenFoodFactsClient(
+            os.getenv("OPENFOODFACTS_API_URL", "https://world.openfoodfacts.org"),
+            request_timeout=args.timeout,
+            deadline=args.timeout * 2,
+            max_per_host=args.concurrency
+        )
+        try:
+            return await build_nutrition_index(labels, client, concurrency=args.concurrency)
+        finally:
+            await client.aclose()
+
+    entries, failed = asyncio.run(run())
+    write_nutrition_index(args.output, entries, FOOD_MODEL)
+    matched = sum(1 for nutrition in entries.values() if nutrition is not None)
+    print(f"✅ Wrote {args.output}: {len(entries)} labels ({matched} with nutrition data)")
+    if failed:
+        print(f"⚠️  {len(failed)} labels failed and will use live lookups: {', '.join(failed[:10])}")
+    return 0
+
+
+def ingest_off_dump_command(args):
+    """Build the local nutrition database from an Open Food Facts bulk dump"""
+    from nutrition_db import build_nutrition_db
+
+    print(f"Ingesting {args.dump} into {args.output}...")
+    result = build_nutrition_db(args.dump, args.output, dump_format=args.format, batch_size=args.batch_size)
+    print(f"✅ Wrote {args.output}: {result['products']} products with nutrition data in {result['seconds']}s")
+    return 0
+
+
+def model_source(model_name):
+    """Local copy under MODEL_DIR if configured, else the Hub id"""
+    model_dir = os.getenv("MODEL_DIR")
+    return os.path.join(model_dir, model_name.replace("/", "--")) if model_dir else model_name
+
+
+def selected_models(choice):
+    return {"food": [FOOD_MODEL], "category": [CATEGORY_MODEL], "all": [FOOD_MODEL, CATEGORY_MODEL]}[choice]
+
+
+def export_model_command(args):
+    """Export the classifiers for the torchscript or onnx inference backend"""
+    from backends import artifact_dir, export_model, load_pipeline
+
+    token = os.getenv("HUGGINGFACE_API_KEY")
+    for model_name in selected_models(args.model):
+        classifier = load_pipeline(model_source(model_name), token)
+        target = artifact_dir(args.output, model_name)
+        path = export_model(classifier, args.backend, target)
+        print(f"✅ Exported {model_name} to {path}")
+    print(f"Set INFERENCE_BACKEND={args.backend} and MODEL_DIR={os.path.abspath(args.output)} to serve it.")
+    return 0
+
+
+def load_parity_images(directory, count):
+    """Images from ``directory``, or seeded random images if none is given"""
+    import random
+    from PIL import Image
+
+    if directory:
+        images = []
+        for name in sorted(os.listdir(directory)):
+            try:
+                with Image.open(os.path.join(directory, name)) as image:
+                    images.append(image.convert("RGB"))
+            except Exception:
+                continue
+        return images[:count] if count else images
+
+    print("⚠️  No --images directory given; using random images (agreement on noise is only a smoke test)")
+    rng = random.Random(0)
+    return [
+        Image.frombytes("RGB", (224, 224), bytes(rng.getrandbits(8) for _ in range(224 * 224 * 3)))
+        for _ in range(count or 8)
+    ]
+
+
+def check_parity_command(args):
+    """Compare a backend's top-1 labels and latency against the original pipeline"""
+    import json
+    import time
+    from backends import check_parity, load_classifier, load_pipeline
+
+    images = load_parity_images(args.images, args.limit)
+    if not images:
+        print("❌ No readable images found")
+        return 1
+
+    token = os.getenv("HUGGINGFACE_API_KEY")
+    passed = True
+    for model_name in selected_models(args.model):
+        reference = load_pipeline(model_source(model_name), token)
+        candidate = load_classifier(args.backend, model_name, model_source(model_name), args.export_dir, token)
+
+        timings = {}
+        for name, classifier in (("pytorch", reference), (args.backend, candidate)):
+            # Warm up on the timed batch shape; TorchScript optimises after a few runs
+            for _ in range(3):
+                classifier(images, batch_size=len(images))
+            started = time.perf_counter()
+            classifier(images, batch_size=len(images))
+            timings[name] = round((time.perf_counter() - started) * 1000 / len(images), 2)
+
+        report = check_parity(reference, candidate, images)
+        report["model"] = model_name
+        report["backend"] = args.backend
+        report["ms_per_image"] = timings
+        print(json.dumps(report, indent=2))
+        if report["agreement"] < args.min_agreement:
+            passed = False
+            print(f"❌ {model_name}: top-1 agreement {report['agreement']:.3f} is below {args.min_agreement}")
+        else:
+            print(f"✅ {model_name}: top-1 agreement {report['agreement']:.3f}")
+    return 0 if passed else 1
+
+
+def download_models_command(args):
+    """Download both classifiers once and save them for offline loading via MODEL_DIR"""
+    from transformers import pipeline
+
+    token = os.getenv("HUGGINGFACE_API_KEY")
+    for model_name in (FOOD_MODEL, CATEGORY_MODEL):
+        target = os.path.join(args.output, model_name.replace("/", "--"))
+        print(f"Downloading {model_name} to {target}...")
+        classifier = pipeline("image-classification", model=model_name, token=token)
+        classifier.save_pretrained(target)
+    print(f"✅ Models saved. Set MODEL_DIR={os.path.abspath(args.output)} to load them without Hub calls.")
+    return 0
+
+
+def backfill_rollups_command(args):
+    """Rebuild the analytics rollup collections from scan history"""
+    import time
+    from pymongo import MongoClient
+    from analytics import rollup_pipelines
+
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/mealscan"))
+    db = client.mealscan
+    history_count = db.scan_history.estimated_document_count()
+    print(f"Rebuilding rollups from about {history_count} scan records...")
+    for collection, pipeline in rollup_pipelines().items():
+        started = time.perf_counter()
+        if args.reset:
+            db[collection].drop()
+        db.scan_history.aggregate(pipeline, allowDiskUse=True)
+        print(
+            f"✅ {collection}: {db[collection].estimated_document_count()} documents "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+    client.close()
+    return 0
+
+
+def serve_command(args):
+    """Run the API with models loaded once and shared by forked workers"""
+    import prefork
+
+    prefork.serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        memory_report_interval=args.memory_report_interval
+    )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MealScan maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser(
+        "build-nutrition-index",
+        help="Precompute nutrition values for every food classifier label"
+    )
+    index_parser.add_argument(
+        "--output", default=os.getenv("NUTRITION_INDEX_PATH", DEFAULT_NUTRITION_INDEX_PATH),
+        help="Index file to write (default: NUTRITION_INDEX_PATH or nutrition_index.json)"
+    )
+    index_parser.add_argument(
+        "--with-categories", action="store_true",
+        help="Also index every 'label (category)' combination used for low-confidence scans"
+    )
+    index_parser.add_argument("--concurrency", type=int, default=4, help="Parallel Open Food Facts requests")
+    index_parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds")
+    index_parser.set_defaults(func=build_nutrition_index_command)
+
+    dump_parser = subparsers.add_parser(
+        "ingest-off-dump",
+        help="Build a local, full-text indexed nutrition database from an Open Food Facts dump"
+    )
+    dump_parser.add_argument(
+        "dump", help="openfoodfacts-products.jsonl or en.openfoodfacts.org.products.csv, optionally .gz"
+    )
+    dump_parser.add_argument(
+        "--output", default=os.getenv("NUTRITION_DB_PATH", DEFAULT_NUTRITION_DB_PATH),
+        help="Database file to write (default: NUTRITION_DB_PATH or off_nutrition.db)"
+    )
+    dump_parser.add_argument(
+        "--format", choices=["jsonl", "csv"],
+        help="Dump format (default: from the file name; anything not .jsonl is read as CSV)"
+    )
+    dump_parser.add_argument("--batch-size", type=int, default=5000, help="Products inserted per transaction")
+    dump_parser.set_defaults(func=ingest_off_dump_command)
+
+    download_parser = subparsers.add_parser(
+        "download-models",
+        help="Save both classifiers to a local directory for offline startup"
+    )
+    download_parser.add_argument(
+        "--output", default=os.getenv("MODEL_DIR", "models"),
+        help="Directory to save models to (default: MODEL_DIR or ./models)"
+    )
+    download_parser.set_defaults(func=download_models_command)
+
+    export_parser = subparsers.add_parser(
+        "export-model",
+        help="Export the classifiers for the torchscript or onnx inference backend"
+    )
+    export_parser.add_argument("--backend", choices=["torchscript", "onnx"], required=True)
+    export_parser.add_argument("--model", choices=["food", "category", "all"], default="all")
+    export_parser.add_argument(
+        "--output", default=os.getenv("MODEL_DIR", "models"),
+        help="Directory to write artifacts to (default: MODEL_DIR or ./models)"
+    )
+    export_parser.set_defaults(func=export_model_command)
+
+    parity_parser = subparsers.add_parser(
+        "check-parity",
+        help="Check a backend's top-1 labels against the original pipeline"
+    )
+    parity_parser.add_argument("--backend", choices=["int8", "torchscript", "onnx"], required=True)
+    parity_parser.add_argument("--model", choices=["food", "category", "all"], default="all")
+    parity_parser.add_argument("--images", help="Directory of sample food images")
+    parity_parser.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    parity_parser.add_argument(
+        "--export-dir", default=os.getenv("MODEL_DIR", "models"),
+        help="Directory holding exported artifacts (default: MODEL_DIR or ./models)"
+    )
+    parity_parser.add_argument(
+        "--min-agreement", type=float, default=0.98,
+        help="Fail if top-1 agreement is below this fraction (default: 0.98)"
+    )
+    parity_parser.set_defaults(func=check_parity_command)
+
+    backfill_parser = subparsers.add_parser(
+        "backfill-rollups",
+        help="Rebuild the per-day and per-food analytics rollups from scan history"
+    )
+    backfill_parser.add_argument(
+        "--reset", action="store_true",
+        help="Drop each rollup collection first, removing entries no longer backed by history"
+    )
+    backfill_parser.set_defaults(func=backfill_rollups_command)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run the API with several workers sharing one copy of the model weights"
+    )
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="Worker processes (default: WEB_CONCURRENCY or CPU count)"
+    )
+    serve_parser.add_argument(
+        "--memory-report-interval", type=float, default=60,
+        help="Seconds between per-worker memory reports in the log (0 disables)"
+    )
+    serve_parser.set_defaults(func=serve_command)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
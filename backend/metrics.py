@@ -0,0 +1,195 @@
+"""Lightweight in-process metrics for the MealScan API"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bucket bounds"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        # One extra slot for observations above the largest bound (+Inf)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        """Return cumulative bucket counts keyed by upper bound"""
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self.count, self.sum
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": total, "sum": round(value_sum, 6)}
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of observations
+
+        Values past the largest bound report the largest value seen. Returns
+        None before the first observation.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, largest = self.count, self.max
+        if not total:
+            return None
+        rank = fraction * total
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            if running >= rank:
+                return min(bound, largest)
+        return largest
+
+
+class Counter:
+    """Monotonic counts keyed by a set of label values"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+
+class HistogramFamily:
+    """Histograms with the same buckets, one per combination of label values"""
+
+    def __init__(self, label_names, buckets):
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *values):
+        with self._lock:
+            if values not in self._histograms:
+                self._histograms[values] = Histogram(self.buckets)
+            histogram = self._histograms[values]
+        histogram.observe(seconds)
+
+    def samples(self):
+        with self._lock:
+            return [(dict(zip(self.label_names, values)), histogram)
+                    for values, histogram in self._histograms.items()]
+
+
+STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Stage timer of the request being handled; set by the timing middleware
+current_stages = contextvars.ContextVar("current_stages", default=None)
+
+
+class StageTimer:
+    """Durations of the named stages of one request, in the order they ran
+
+    A stage that runs more than once (e.g. per image in a batch) adds up.
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def server_timing(self, total=None):
+        """``Server-Timing`` header value, durations in milliseconds"""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage ``name`` of the current request
+
+    Outside a request (no timer set) the block simply runs.
+    """
+    timer = current_stages.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, time.perf_counter() - started)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def prometheus_metric(name, kind, help_text, samples):
+    """Exposition lines for a counter or gauge; ``samples`` is ``[(labels, value), ...]``"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return lines
+
+
+def prometheus_histogram(name, help_text, histograms):
+    """Exposition lines for histograms; ``histograms`` is ``[(labels, Histogram), ...]``"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in histograms:
+        snapshot = histogram.snapshot()
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+    return lines
+
+
+def process_memory(pid="self"):
+    """Memory of a process in bytes from /proc/<pid>/smaps_rollup (Linux only)
+
+    ``pss`` splits shared pages between the processes mapping them, so
+    summing it over workers gives the real total; ``shared`` counts pages
+    still shared copy-on-write with other processes. Returns None where
+    the information isn't available.
+    """
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    memory = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] += int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    return memory
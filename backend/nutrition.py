@@ -0,0 +1,141 @@
+"""Open Food Facts lookups for the MealScan API"""
+
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPENFOODFACTS_URL = "https://world.openfoodfacts.org"
+
+
+def default_nutrition():
+    """Nutrition values returned when nothing better is known"""
+    return {
+        "calories": 0.0,
+        "proteins": 0.0,
+        "fats": 0.0,
+        "carbs": 0.0,
+        "serving_size": "100g"
+    }
+
+
+def _to_float(value):
+    """Convert an OFF nutriment value to float, or None if it isn't numeric"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def nutriment_values(nutriments):
+    """Calories, proteins, fats and carbs per 100g from a ``nutriments`` dict; None where missing"""
+    calories = _to_float(nutriments.get("energy-kcal_100g"))
+    if calories is None:
+        # Many products only list energy in kJ
+        energy_kj = _to_float(nutriments.get("energy_100g"))
+        calories = energy_kj / 4.184 if energy_kj is not None else None  # Convert kJ to kcal
+
+    return {
+        "calories": calories,
+        "proteins": _to_float(nutriments.get("proteins_100g")),
+        "fats": _to_float(nutriments.get("fat_100g")),
+        "carbs": _to_float(nutriments.get("carbohydrates_100g")),
+    }
+
+
+def parse_nutriments(nutriments):
+    """Turn an Open Food Facts ``nutriments`` dict into our nutrition format"""
+    values = nutriment_values(nutriments)
+    return {
+        "calories": round(values["calories"] or 0.0, 1),
+        "proteins": round(values["proteins"] or 0.0, 1),
+        "fats": round(values["fats"] or 0.0, 1),
+        "carbs": round(values["carbs"] or 0.0, 1),
+        "serving_size": "100g"
+    }
+
+
+def _first_product(data):
+    products = data.get("products") if isinstance(data, dict) else None
+    return products[0] if products else None
+
+
+class OpenFoodFactsClient:
+    """Shared async client for the Open Food Facts website API
+
+    All lookups reuse one pooled ``httpx.AsyncClient`` so connections stay
+    alive between scans. ``max_per_host`` caps concurrent requests to a
+    single host and ``deadline`` bounds the whole lookup (search plus the
+    category fallback), not each request on its own.
+
+    Only the scheme and host of ``base_url`` are used, so a local stub
+    server can stand in for Open Food Facts by pointing it at
+    ``http://127.0.0.1:<port>``.
+    """
+
+    def __init__(self, base_url=DEFAULT_OPENFOODFACTS_URL, request_timeout=10.0, deadline=10.0,
+                 max_connections=20, max_per_host=8, transport=None):
+        parts = urlsplit(base_url or DEFAULT_OPENFOODFACTS_URL)
+        self.base_url = f"{parts.scheme}://{parts.netloc}"
+        self.deadline = deadline
+        self.max_per_host = max_per_host
+        self._host_limits = {}
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=request_timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            headers={"User-Agent": "MealScan/1.0"},
+            transport=transport
+        )
+
+    def _host_limit(self, host):
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def _get(self, path, params=None):
+        url = self._client.base_url.join(path)
+        async with self._host_limit(url.host):
+            return await self._client.get(path, params=params)
+
+    async def lookup(self, food_item):
+        """Return nutrition for ``food_item`` or None when OFF has no match
+
+        Raises ``asyncio.TimeoutError`` if the deadline expires and
+        ``httpx.HTTPError`` if the search request fails.
+        """
+        return await asyncio.wait_for(self._lookup(food_item), self.deadline)
+
+    async def _lookup(self, food_item):
+        # Search for the food item using the public API
+        params = {
+            "search_terms": food_item,
+            "search_simple": 1,
+            "action": "process",
+            "json": 1,
+            "page_size": 1
+        }
+        response = await self._get("/cgi/search.pl", params=params)
+        response.raise_for_status()
+        product = _first_product(response.json())
+        if product is not None:
+            return parse_nutriments(product.get("nutriments", {}))
+
+        # If no product found, try searching by category
+        category = food_item.lower().replace(" ", "-")
+        response = await self._get(f"/category/{category}/1.json")
+        if response.status_code == 200:
+            product = _first_product(response.json())
+            if product is not None:
+                return parse_nutriments(product.get("nutriments", {}))
+
+        return None
+
+    async def aclose(self):
+        await self._client.aclose()
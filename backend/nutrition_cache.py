@@ -0,0 +1,257 @@
+"""Tiered cache for nutrition lookups keyed by food label"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_label(label):
+    """Normalize a classifier label into a cache key
+
+    ``"French_Fries "`` and ``"french fries"`` map to the same key. A
+    category suffix such as ``"pizza (fast food)"`` is kept, since it
+    changes what we search for.
+    """
+    key = label.strip().lower().replace("_", " ").replace("-", " ")
+    return re.sub(r"\s+", " ", key)
+
+
+class SingleFlight:
+    """Deduplicates concurrent async calls that share a key
+
+    The first caller for a key starts the call as a task; callers that
+    arrive while it is in flight await the same task and receive its
+    result or exception. The task is shielded, so one caller going away
+    does not cancel the call for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.get_running_loop().create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
+
+
+class MongoNutritionStore:
+    """Persistent cache tier in the ``nutrition_cache`` MongoDB collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key):
+        doc = await self.collection.find_one({"_id": key})
+        if doc is None:
+            return None
+        return {"nutrition": doc.get("nutrition"), "fetched_at": doc["fetched_at"]}
+
+    async def set(self, key, entry):
+        await self.collection.replace_one({"_id": key}, {"_id": key, **entry}, upsert=True)
+
+
+class FileNutritionStore:
+    """Persistent cache tier in a local JSON file
+
+    The classifier has a small, fixed label set so the whole file is kept
+    in memory and rewritten atomically on every update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring unreadable nutrition cache file {self.path}: {str(e)}")
+                self._entries = {}
+        return self._entries
+
+    def _write(self, entries):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    async def get(self, key):
+        return self._load().get(key)
+
+    async def set(self, key, entry):
+        entries = self._load()
+        entries[key] = entry
+        await asyncio.to_thread(self._write, dict(entries))
+
+
+class NutritionCache:
+    """In-process LRU with TTL in front of an optional persistent store
+
+    Entries younger than ``ttl`` seconds are served as-is. Entries up to
+    ``stale_ttl`` seconds past that are still served, but trigger a
+    background refresh (stale-while-revalidate). Older entries count as a
+    miss and are fetched before returning.
+
+    A lookup that found no match is cached as ``None`` as well, so labels
+    Open Food Facts doesn't know are not searched on every scan. Errors
+    are never cached. Concurrent misses for one label are coalesced into
+    a single fetch.
+    """
+
+    def __init__(self, store=None, max_entries=512, ttl=24 * 3600, stale_ttl=7 * 24 * 3600):
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._refreshing = {}
+        self.flight = SingleFlight()
+        self.stats_counters = {
+            "memory_hits": 0,
+            "store_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "store_errors": 0,
+            "expired_served": 0,
+        }
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _store_get(self, key):
+        if self.store is None:
+            return None
+        try:
+            return await self.store.get(key)
+        except Exception as e:
+            self.stats_counters["store_errors"] += 1
+            logger.error(f"Error reading nutrition cache store: {str(e)}")
+            return None
+
+    async def _store_set(self, key, entry):
+        if self.store is None:
+            return
+        try:
+            await self.store.set(key, entry)
+        except Exception as e:
+            self.stats_counters["store_errors"] += 1
+            logger.error(f"Error writing nutrition cache store: {str(e)}")
+
+    async def _fetch(self, key, food_item, fetch):
+        # Concurrent misses for the same label share one upstream lookup
+        return await self.flight.do(key, lambda: self._fetch_and_store(key, food_item, fetch))
+
+    async def _fetch_and_store(self, key, food_item, fetch):
+        nutrition = await fetch(food_item)
+        entry = {"nutrition": nutrition, "fetched_at": time.time()}
+        self._remember(key, entry)
+        await self._store_set(key, entry)
+        return nutrition
+
+    def _refresh_in_background(self, key, food_item, fetch):
+        if key in self._refreshing:
+            return
+        self.stats_counters["refreshes"] += 1
+
+        async def refresh():
+            try:
+                await self._fetch(key, food_item, fetch)
+            except Exception as e:
+                self.stats_counters["refresh_errors"] += 1
+                logger.warning(f"Background nutrition refresh for {key} failed: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.get_running_loop().create_task(refresh())
+
+    async def get(self, food_item, fetch):
+        """Return cached nutrition for ``food_item``, calling ``fetch`` on a miss
+
+        ``fetch`` is an async callable taking the food item and returning a
+        nutrition dict or None. Its exceptions propagate to the caller.
+        """
+        key = normalize_label(food_item)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats_counters["memory_hits"] += 1
+        else:
+            entry = await self._store_get(key)
+            if entry is not None:
+                self._remember(key, entry)
+                self.stats_counters["store_hits"] += 1
+
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < self.ttl:
+                return entry["nutrition"]
+            if age < self.ttl + self.stale_ttl:
+                self.stats_counters["stale_served"] += 1
+                self._refresh_in_background(key, food_item, fetch)
+                return entry["nutrition"]
+
+        self.stats_counters["misses"] += 1
+        return await self._fetch(key, food_item, fetch)
+
+    async def last_known(self, food_item):
+        """``(found, nutrition)`` from any cached entry, however old
+
+        Used when a fresh lookup can't be made: an expired answer is
+        better than none.
+        """
+        key = normalize_label(food_item)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = await self._store_get(key)
+        if entry is None:
+            return False, None
+        self.stats_counters["expired_served"] += 1
+        return True, entry["nutrition"]
+
+    def stats(self):
+        lookups = sum(self.stats_counters[name] for name in ("memory_hits", "store_hits", "misses"))
+        hits = lookups - self.stats_counters["misses"]
+        return {
+            **self.stats_counters,
+            "entries": len(self._entries),
+            "store": type(self.store).__name__ if self.store is not None else None,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "upstream_calls": self.flight.calls,
+            "coalesced": self.flight.coalesced,
+            "in_flight": self.flight.in_flight,
+        }
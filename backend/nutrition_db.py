@@ -0,0 +1,298 @@
+"""Local nutrition database built from the Open Food Facts bulk dump"""
+
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from nutrition import nutriment_values, parse_nutriments
+from nutrition_cache import normalize_label
+
+logger = logging.getLogger(__name__)
+
+# 2: kJ-only products get their calories converted instead of 0 kcal, and
+# completeness counts parsed values
+DB_VERSION = 2
+
+# The only nutriments parse_nutriments reads; everything else in the dump is dropped
+NUTRIMENT_FIELDS = ("energy-kcal_100g", "energy_100g", "proteins_100g", "fat_100g", "carbohydrates_100g")
+
+SCHEMA = """
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY,
+    code TEXT,
+    name TEXT,
+    categories TEXT,
+    popularity INTEGER,
+    completeness INTEGER,
+    calories REAL,
+    proteins REAL,
+    fats REAL,
+    carbs REAL
+);
+CREATE VIRTUAL TABLE products_fts USING fts5(
+    name, categories, content='products', content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Products with more of the four values first (a missing one reads as 0),
+# then the best text match, with name matches counting five times as much
+# as category matches, then the most scanned
+RANK = "p.completeness DESC, bm25(products_fts, 5.0, 1.0), p.popularity DESC"
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, encoding="utf-8", errors="replace", newline="")
+
+
+def _categories(value):
+    """``"en:pizzas,en:pies-and-pizzas"`` or a tag list to ``"pizzas, pies and pizzas"``"""
+    tags = value if isinstance(value, list) else (value or "").split(",")
+    names = []
+    for tag in tags:
+        name = tag.split(":", 1)[-1].replace("-", " ").strip()
+        if name and name not in names:
+            names.append(name)
+    return ", ".join(names)
+
+
+def _product(code, name, categories, popularity, nutriments):
+    """A products row, or None if the product has no usable name or nutriments"""
+    nutriments = {
+        field: nutriments[field] for field in NUTRIMENT_FIELDS
+        if nutriments.get(field) not in (None, "")
+    }
+    if not name or not nutriments:
+        return None
+    nutrition = parse_nutriments(nutriments)
+    try:
+        popularity = int(float(popularity or 0))
+    except (TypeError, ValueError):
+        popularity = 0
+    # Values that parse as numbers, so a non-numeric field doesn't count as known
+    completeness = sum(1 for value in nutriment_values(nutriments).values() if value is not None)
+    return (code, name.strip(), categories, popularity, completeness,
+            nutrition["calories"], nutrition["proteins"], nutrition["fats"], nutrition["carbs"])
+
+
+def iter_jsonl_products(lines):
+    """Rows from the ``openfoodfacts-products.jsonl`` dump, one product per line"""
+    for line in lines:
+        try:
+            product = json.loads(line)
+        except ValueError:
+            continue
+        row = _product(
+            product.get("code"),
+            product.get("product_name") or product.get("product_name_en") or product.get("generic_name"),
+            _categories(product.get("categories_tags") or product.get("categories")),
+            product.get("unique_scans_n"),
+            product.get("nutriments") or {},
+        )
+        if row is not None:
+            yield row
+
+
+def iter_csv_products(lines):
+    """Rows from the tab-separated ``en.openfoodfacts.org.products.csv`` dump"""
+    # Some free-text columns are far longer than csv's default field limit
+    csv.field_size_limit(sys.maxsize)
+    for record in csv.DictReader(lines, delimiter="\t", quoting=csv.QUOTE_NONE):
+        row = _product(
+            record.get("code"),
+            record.get("product_name") or record.get("generic_name"),
+            _categories(record.get("categories_tags") or record.get("categories_en")),
+            record.get("unique_scans_n"),
+            record,
+        )
+        if row is not None:
+            yield row
+
+
+def detect_dump_format(path):
+    """``"jsonl"`` or ``"csv"`` from the dump's file name"""
+    name = path[:-3] if path.endswith(".gz") else path
+    return "jsonl" if name.endswith((".jsonl", ".json")) else "csv"
+
+
+def build_nutrition_db(dump_path, output, dump_format=None, batch_size=5000):
+    """Stream a dump into a new SQLite database at ``output``
+
+    Products are read and inserted ``batch_size`` at a time, so memory
+    stays flat however large the dump is. The database is written next
+    to ``output`` and moved into place once complete. Returns the
+    database metadata plus the build time in seconds.
+    """
+    dump_format = dump_format or detect_dump_format(dump_path)
+    rows = iter_jsonl_products if dump_format == "jsonl" else iter_csv_products
+    tmp_path = f"{output}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    started = time.perf_counter()
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+        count = 0
+        with _open_text(dump_path) as f:
+            batch = []
+            for row in rows(f):
+                count += 1
+                batch.append((count, *row))
+                if len(batch) >= batch_size:
+                    _insert(connection, batch)
+                    batch = []
+                    if count % (batch_size * 100) == 0:
+                        logger.info(f"Ingested {count} products")
+            _insert(connection, batch)
+
+        connection.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+        metadata = {
+            "version": DB_VERSION,
+            "source": os.path.basename(dump_path),
+            "built_at": datetime.utcnow().isoformat(),
+            "products": count,
+        }
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in metadata.items()])
+        connection.commit()
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+    os.replace(tmp_path, output)
+    return {**metadata, "seconds": round(time.perf_counter() - started, 1)}
+
+
+def _insert(connection, batch):
+    if not batch:
+        return
+    connection.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    connection.executemany(
+        "INSERT INTO products_fts(rowid, name, categories) VALUES (?, ?, ?)",
+        [(row[0], row[2], row[3]) for row in batch]
+    )
+    connection.commit()
+
+
+def _match_query(text):
+    """FTS5 query requiring every word of ``text``, each quoted so nothing is read as syntax"""
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"' for word in words)
+
+
+class NutritionDatabase:
+    """Read-only nutrition lookups against a database from ``build_nutrition_db``
+
+    A food item is matched like the Open Food Facts search: every word
+    must appear in the product name or categories. Of the matches, the
+    product with the most complete nutrition wins, then the best text
+    match, then the most scanned. Category-suffixed items such
+    as ``"pizza (fast food)"`` that match nothing are retried without
+    the suffix. Answers are memoized per normalized label.
+    """
+
+    def __init__(self, path, memo_size=4096):
+        self.path = path
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._local = threading.local()
+        self.metadata = dict(self._connection().execute("SELECT key, value FROM meta").fetchall())
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    @classmethod
+    def open(cls, path):
+        """Open the database at ``path``, or return None if it is missing or unreadable"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            db = cls(path)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open nutrition database {path}: {str(e)}")
+            return None
+        if db.metadata.get("version") != str(DB_VERSION):
+            logger.error(f"Ignoring nutrition database {path} with unsupported version {db.metadata.get('version')}")
+            return None
+        logger.info(f"Opened nutrition database {path} with {db.metadata.get('products')} products")
+        return db
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads; lookups run in worker threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def _search(self, text):
+        query = _match_query(text)
+        if not query:
+            return None
+        return self._connection().execute(
+            f"SELECT p.calories, p.proteins, p.fats, p.carbs FROM products_fts "
+            f"JOIN products p ON p.id = products_fts.rowid "
+            f"WHERE products_fts MATCH ? ORDER BY {RANK} LIMIT 1",
+            (query,)
+        ).fetchone()
+
+    def lookup(self, food_item):
+        """Nutrition for ``food_item`` in the API's format, or None if nothing matches"""
+        key = normalize_label(food_item)
+        with self._memo_lock:
+            memoized = key in self._memo
+            if memoized:
+                self._memo.move_to_end(key)
+                nutrition = self._memo[key]
+        if not memoized:
+            started = time.perf_counter()
+            row = self._search(key)
+            base = re.sub(r"\s*\(.*\)\s*$", "", key)
+            if row is None and base != key:
+                row = self._search(base)
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+            nutrition = None
+            if row is not None:
+                calories, proteins, fats, carbs = row
+                nutrition = {
+                    "calories": calories,
+                    "proteins": proteins,
+                    "fats": fats,
+                    "carbs": carbs,
+                    "serving_size": "100g"
+                }
+            with self._memo_lock:
+                self._memo[key] = nutrition
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+
+        if nutrition is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(nutrition)
+
+    def stats(self):
+        return {
+            "products": int(self.metadata.get("products", 0)),
+            "source": self.metadata.get("source"),
+            "built_at": self.metadata.get("built_at"),
+            "hits": self.hits,
+            "misses": self.misses,
+            "queries": self.queries,
+            "mean_query_ms": round(self.query_seconds / self.queries * 1000, 3) if self.queries else None,
+        }
@@ -0,0 +1,105 @@
+"""Precomputed nutrition values for every classifier label"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+
+from nutrition_cache import normalize_label
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+class NutritionIndex:
+    """Read-only map from normalized food label to nutrition values
+
+    The index is built offline by ``manage.py build-nutrition-index`` and
+    loaded once at startup. A label stored with a ``None`` value was looked
+    up and has no Open Food Facts match; a label missing from the index
+    has never been looked up and should go to the live lookup.
+    """
+
+    def __init__(self, entries=None, metadata=None):
+        self.entries = entries or {}
+        self.metadata = metadata or {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path):
+        """Load an index file, returning an empty index if it is missing"""
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read nutrition index {path}: {str(e)}")
+            return cls()
+        if data.get("version") != INDEX_VERSION:
+            logger.error(f"Ignoring nutrition index {path} with unsupported version {data.get('version')}")
+            return cls()
+        entries = data.get("entries", {})
+        metadata = {key: value for key, value in data.items() if key != "entries"}
+        logger.info(f"Loaded nutrition index with {len(entries)} labels from {path}")
+        return cls(entries, metadata)
+
+    def lookup(self, food_item):
+        """Return ``(found, nutrition)`` for ``food_item``"""
+        key = normalize_label(food_item)
+        if key in self.entries:
+            self.hits += 1
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {
+            "labels": len(self.entries),
+            "model": self.metadata.get("model"),
+            "built_at": self.metadata.get("built_at"),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+async def build_nutrition_index(labels, client, concurrency=4):
+    """Resolve every label through ``client`` and return the index entries
+
+    Labels that fail to resolve (network errors, timeouts) are left out so
+    the server falls back to a live lookup for them.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    entries = {}
+    failed = []
+
+    async def resolve(label):
+        async with semaphore:
+            try:
+                entries[normalize_label(label)] = await client.lookup(label)
+            except Exception as e:
+                failed.append(label)
+                logger.warning(f"Could not resolve nutrition for {label}: {str(e)}")
+
+    await asyncio.gather(*(resolve(label) for label in labels))
+    return entries, failed
+
+
+def write_nutrition_index(path, entries, model):
+    """Write index entries to ``path`` as compact JSON"""
+    data = {
+        "version": INDEX_VERSION,
+        "model": model,
+        "built_at": datetime.utcnow().isoformat(),
+        "entries": dict(sorted(entries.items())),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
@@ -0,0 +1,94 @@
+"""Cheap food / non-food gate run before the food classifier"""
+
+import logging
+import time
+
+from PIL import Image, ImageChops, ImageStat
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+NOT_FOOD_MESSAGE = "This doesn't appear to be a food image. Please upload a clear photo of food."
+
+
+class FoodPrefilter:
+    """Rejects obvious non-food images from a small thumbnail
+
+    Three colour and texture measures are taken on a
+    ``thumbnail_size`` square thumbnail:
+
+    - ``saturation``: mean HSV saturation (0-1); documents, screenshots of
+      text and black-and-white pictures sit near 0
+    - ``uniform_fraction``: share of pixels in the most common colour after
+      coarse quantisation; blank and single-colour images sit near 1
+    - ``detail``: mean brightness difference between neighbouring pixels
+      (0-1); featureless images sit near 0
+
+    An image failing any threshold is rejected without running a model.
+    The thresholds are deliberately loose: the food classifier still
+    validates everything the prefilter lets through. Smooth foods (soup,
+    cake, mashed potato) have little detail once scaled down, so the
+    thumbnail is kept large enough for their texture to survive.
+    """
+
+    def __init__(self, min_saturation=0.03, max_uniform_fraction=0.95, min_detail=0.004, thumbnail_size=128):
+        self.min_saturation = min_saturation
+        self.max_uniform_fraction = max_uniform_fraction
+        self.min_detail = min_detail
+        self.thumbnail_size = thumbnail_size
+        self.checked = 0
+        self.rejected = {"saturation": 0, "uniform_fraction": 0, "detail": 0}
+        self.seconds = Histogram([0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01])
+
+    def features(self, image):
+        thumbnail = image.convert("RGB").resize((self.thumbnail_size, self.thumbnail_size), Image.BILINEAR)
+        pixels = self.thumbnail_size * self.thumbnail_size
+
+        saturation = ImageStat.Stat(thumbnail.convert("HSV")).mean[1] / 255
+
+        # 8 levels per channel, so JPEG noise doesn't hide a flat background
+        quantized = thumbnail.point(lambda value: value & 0xE0)
+        uniform_fraction = max(count for count, _ in quantized.getcolors(pixels)) / pixels
+
+        gray = thumbnail.convert("L")
+        width, height = gray.size
+        difference = ImageChops.difference(gray.crop((1, 0, width, height)), gray.crop((0, 0, width - 1, height)))
+        detail = ImageStat.Stat(difference).mean[0] / 255
+
+        return {"saturation": saturation, "uniform_fraction": uniform_fraction, "detail": detail}
+
+    def check(self, image):
+        """Return ``(passed, features)``; ``features["rejected_by"]`` names the failed measure"""
+        started = time.perf_counter()
+        features = self.features(image)
+        self.seconds.observe(time.perf_counter() - started)
+        self.checked += 1
+
+        if features["saturation"] < self.min_saturation:
+            features["rejected_by"] = "saturation"
+        elif features["uniform_fraction"] > self.max_uniform_fraction:
+            features["rejected_by"] = "uniform_fraction"
+        elif features["detail"] < self.min_detail:
+            features["rejected_by"] = "detail"
+        else:
+            return True, features
+
+        self.rejected[features["rejected_by"]] += 1
+        return False, features
+
+    def stats(self):
+        rejected = sum(self.rejected.values())
+        return {
+            "thresholds": {
+                "min_saturation": self.min_saturation,
+                "max_uniform_fraction": self.max_uniform_fraction,
+                "min_detail": self.min_detail,
+            },
+            "thumbnail_size": self.thumbnail_size,
+            "checked": self.checked,
+            "rejected": rejected,
+            "rejected_by": dict(self.rejected),
+            "reject_rate": rejected / self.checked if self.checked else None,
+            "seconds": self.seconds.snapshot(),
+        }
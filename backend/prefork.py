@@ -0,0 +1,133 @@
+"""Preforking server that shares model weights between workers
+
+The parent process loads both pipelines once, then forks the workers.
+Forked children share the parent's memory pages copy-on-write, and the
+model weights are never written after loading, so they stay shared no
+matter how many workers run. Each worker runs its own uvicorn server on
+a socket inherited from the parent.
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+from metrics import process_memory
+
+logger = logging.getLogger(__name__)
+
+
+def _format_mb(value):
+    return f"{value / (1024 * 1024):.0f}MB"
+
+
+def report_worker_memory(workers):
+    """Log RSS/PSS and shared/private memory of every worker"""
+    total_pss = 0
+    for pid, index in sorted(workers.items(), key=lambda item: item[1]):
+        memory = process_memory(pid)
+        if memory is None:
+            continue
+        total_pss += memory["pss"]
+        logger.info(
+            f"Worker {index} (pid {pid}): rss {_format_mb(memory['rss'])}, pss {_format_mb(memory['pss'])}, "
+            f"shared {_format_mb(memory['shared'])}, private {_format_mb(memory['private'])}"
+        )
+    if total_pss:
+        logger.info(f"Total worker PSS: {_format_mb(total_pss)}")
+
+
+def _bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(main, sock, index, workers, log_level):
+    import uvicorn
+
+    # Give each worker its share of the cores instead of every worker
+    # spawning one torch thread per core
+    main.set_intra_op_threads(workers)
+
+    config = uvicorn.Config(main.app, lifespan="on", log_level=log_level)
+    server = uvicorn.Server(config)
+    logger.info(f"Worker {index} started (pid {os.getpid()})")
+    server.run(sockets=[sock])
+
+
+def serve(host="0.0.0.0", port=8000, workers=2, memory_report_interval=60, log_level="info"):
+    """Load models once, fork ``workers`` uvicorn workers and supervise them"""
+    import main
+
+    if os.name != "posix":
+        raise RuntimeError("The prefork server needs os.fork (Linux/macOS)")
+
+    # Warm-up runs in each worker: starting torch's thread pools before fork
+    # is not fork-safe
+    main.load_models(warmup=False, processes=workers)
+    if main.food_classifier is None:
+        raise RuntimeError(f"Could not load models: {main.model_state['error']}")
+
+    # Move everything allocated so far out of the GC's reach so collections
+    # in the workers don't touch (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind(host, port)
+    logger.info(f"Listening on {host}:{port}, starting {workers} workers")
+
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                _run_worker(main, sock, index, workers, log_level)
+            finally:
+                os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+
+    last_report = time.monotonic()
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = children.pop(pid)
+            if not stopping:
+                logger.warning(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+                spawn(index)
+            continue
+
+        if memory_report_interval and time.monotonic() - last_report >= memory_report_interval:
+            report_worker_memory(children)
+            last_report = time.monotonic()
+        time.sleep(0.5)
+
+    sock.close()
+    logger.info("All workers stopped")
@@ -0,0 +1,79 @@
+"""Cache of full scan results keyed by image content"""
+
+import copy
+import time
+from collections import OrderedDict
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class ScanResultCache:
+    """Bounded LRU of scan responses with a TTL
+
+    Results are keyed by a hash of the raw upload. An entry may also carry
+    a perceptual hash of the decoded image so that a re-encoded or resized
+    copy of the same photo can be matched with ``get_similar``.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+
+    def _expired(self, entry):
+        return time.monotonic() - entry["stored_at"] >= self.ttl
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(entry["result"])
+
+    def get_similar(self, perceptual_hash, max_distance):
+        """Return the result whose perceptual hash is closest, within ``max_distance`` bits"""
+        best_key, best_distance = None, max_distance + 1
+        for key, entry in self._entries.items():
+            if entry["perceptual_hash"] is None or self._expired(entry):
+                continue
+            distance = hamming_distance(entry["perceptual_hash"], perceptual_hash)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return self.get(best_key) if best_key is not None else None
+
+    def put(self, key, result, perceptual_hash=None):
+        self._entries[key] = {
+            "result": copy.deepcopy(result),
+            "perceptual_hash": perceptual_hash,
+            "stored_at": time.monotonic(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def record(self, status):
+        if status == "HIT":
+            self.hits += 1
+        elif status == "HIT-PERCEPTUAL":
+            self.perceptual_hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        lookups = self.hits + self.perceptual_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.perceptual_hits) / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,122 @@
+"""Circuit breaker around Open Food Facts lookups"""
+
+import asyncio
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def fail():
+    raise RuntimeError("upstream down")
+
+
+async def succeed():
+    return "ok"
+
+
+def open_breaker(clock):
+    breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=30, clock=clock)
+
+    async def trip():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await breaker.call(fail)
+
+    asyncio.run(trip())
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_opens_after_failure_rate_and_rejects_without_calling():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    calls = 0
+
+    async def counted():
+        nonlocal calls
+        calls += 1
+
+    with pytest.raises(CircuitOpenError) as error:
+        asyncio.run(breaker.call(counted))
+    assert calls == 0
+    assert error.value.retry_after == 30
+    assert (breaker.opened, breaker.rejected) == (1, 1)
+
+
+def test_half_open_allows_only_one_trial_call():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 30
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_success():
+            await release.wait()
+            return "ok"
+
+        trial = asyncio.create_task(breaker.call(slow_success))
+        await asyncio.sleep(0)
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(succeed)
+        release.set()
+        return await trial
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_calls"] == 0
+
+
+def test_failed_trial_reopens():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 30
+    with pytest.raises(RuntimeError):
+        asyncio.run(breaker.call(fail))
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(breaker.call(succeed))
+
+
+def test_cancelled_trial_frees_the_slot():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 30
+
+    async def scenario():
+        trial = asyncio.create_task(breaker.call(asyncio.sleep, 10))
+        await asyncio.sleep(0)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return await breaker.call(succeed)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_open_the_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=4, min_calls=2, slow_call_seconds=2, slow_call_rate=0.5, clock=clock)
+
+    async def slow():
+        clock.now += 3
+        return "ok"
+
+    async def scenario():
+        for _ in range(2):
+            await breaker.call(slow)
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
@@ -0,0 +1,66 @@
+"""Keyset pagination cursors for /api/history"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from history import decode_cursor, encode_cursor, history_filter, history_projection
+
+
+def matches(record, query):
+    """Evaluate the subset of MongoDB queries history_filter builds"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(record, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not record[field] < condition["$lt"]:
+                return False
+        elif record[field] != condition:
+            return False
+    return True
+
+
+def newest_first(records):
+    return sorted(records, key=lambda record: (record["timestamp"], record["_id"]), reverse=True)
+
+
+def test_cursor_round_trip():
+    record = {"timestamp": datetime(2026, 3, 1, 12, 30, 15, 123000), "_id": ObjectId()}
+    assert decode_cursor(encode_cursor(record)) == (record["timestamp"], record["_id"])
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "2026-03-01T12:00:00", "2026-03-01T12:00:00,xyz"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_ties_on_one_timestamp_exactly_once():
+    # Scans stored in the same millisecond share a timestamp; _id orders them
+    same_time = datetime(2026, 3, 1, 12, 0)
+    records = [{"timestamp": same_time, "_id": ObjectId()} for _ in range(5)]
+    records += [{"timestamp": same_time - timedelta(seconds=seconds), "_id": ObjectId()} for seconds in (1, 2)]
+    records += [{"timestamp": same_time + timedelta(seconds=1), "_id": ObjectId()}]
+
+    seen = []
+    before = None
+    while True:
+        page = newest_first(record for record in records if matches(record, history_filter(before)))[:2]
+        if not page:
+            break
+        seen += page
+        before = encode_cursor(page[-1])
+
+    assert seen == newest_first(records)
+
+
+def test_first_page_has_no_filter():
+    assert history_filter(None) == {}
+
+
+def test_projection_always_keeps_cursor_fields():
+    assert history_projection("food_item") == {"_id": 1, "timestamp": 1, "food_item": 1}
+    with pytest.raises(ValueError):
+        history_projection("food_item,password")
@@ -0,0 +1,98 @@
+"""Micro-batching of concurrent classifier calls"""
+
+import asyncio
+
+import pytest
+
+from inference import InferenceExecutor, InferenceQueueFull, MicroBatcher
+
+
+class RecordingModel:
+    """Batch function that returns each image's label and remembers every batch"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, images):
+        self.batches.append(list(images))
+        return [f"label-{image}" for image in images]
+
+
+def run_batcher(scenario, max_batch_size=8, max_wait_ms=10):
+    model = RecordingModel()
+    executor = InferenceExecutor(max_workers=1, max_queue=4)
+    try:
+        batcher = MicroBatcher(model, executor, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        return asyncio.run(scenario(batcher)), model, batcher
+    finally:
+        executor.shutdown()
+
+
+def test_concurrent_submits_share_one_batch():
+    async def scenario(batcher):
+        return await asyncio.gather(*(batcher.submit(image) for image in range(3)))
+
+    results, model, _ = run_batcher(scenario)
+    assert results == ["label-0", "label-1", "label-2"]
+    assert model.batches == [[0, 1, 2]]
+
+
+def test_full_batch_is_sent_without_waiting():
+    async def scenario(batcher):
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(image) for image in range(4))), 5)
+
+    # The wait is far longer than the test is allowed, so only full batches can finish it
+    results, model, _ = run_batcher(scenario, max_batch_size=2, max_wait_ms=60000)
+    assert results == ["label-0", "label-1", "label-2", "label-3"]
+    assert model.batches == [[0, 1], [2, 3]]
+
+
+def test_cancelled_callers_are_skipped():
+    async def scenario(batcher):
+        kept = asyncio.create_task(batcher.submit("kept"))
+        dropped = asyncio.create_task(batcher.submit("dropped"))
+        await asyncio.sleep(0)
+        dropped.cancel()
+        return await kept
+
+    result, model, batcher = run_batcher(scenario)
+    assert result == "label-kept"
+    assert model.batches == [["kept"]]
+    assert batcher.skipped == 1
+
+
+def test_batch_error_reaches_every_caller():
+    def failing_model(images):
+        raise RuntimeError("model failed")
+
+    async def scenario():
+        executor = InferenceExecutor(max_workers=1, max_queue=4)
+        try:
+            batcher = MicroBatcher(failing_model, executor, max_wait_ms=10)
+            return await asyncio.gather(*(batcher.submit(image) for image in range(2)), return_exceptions=True)
+        finally:
+            executor.shutdown()
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["model failed", "model failed"]
+
+
+def test_executor_rejects_past_its_queue():
+    async def scenario():
+        executor = InferenceExecutor(max_workers=1, max_queue=0)
+        release = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            busy = asyncio.create_task(executor.run(lambda: asyncio.run_coroutine_threadsafe(release.wait(), loop).result()))
+            await asyncio.sleep(0.01)
+            with pytest.raises(InferenceQueueFull):
+                await executor.run(lambda: None)
+            release.set()
+            await busy
+            return executor.stats()
+        finally:
+            executor.shutdown()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 1
@@ -0,0 +1,89 @@
+"""Coalescing of concurrent nutrition lookups"""
+
+import asyncio
+
+import pytest
+
+from nutrition_cache import NutritionCache, SingleFlight, normalize_label
+
+
+def test_concurrent_calls_share_one_result():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"calories": 266.0}
+
+        results = await asyncio.gather(*(flight.do("pizza", fetch) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert results == [{"calories": 266.0}] * 5
+    assert (flight.calls, flight.coalesced, flight.in_flight) == (1, 4, 0)
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        return flight, await asyncio.gather(*(flight.do("pizza", fetch) for _ in range(3)), return_exceptions=True)
+
+    flight, results = asyncio.run(scenario())
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) and str(result) == "upstream down" for result in results)
+    # The failed call is forgotten, so the next caller starts a fresh one
+    assert flight.in_flight == 0
+
+
+def test_cancelled_waiter_does_not_cancel_the_call_for_others():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("pizza", fetch))
+        second = asyncio.create_task(flight.do("pizza", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_lookup_errors_are_not_cached():
+    async def scenario():
+        cache = NutritionCache()
+        attempts = 0
+
+        async def fetch(food_item):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise RuntimeError("timeout")
+            return {"calories": 52.0}
+
+        with pytest.raises(RuntimeError):
+            await cache.get("Apple_Pie", fetch)
+        return await cache.get("apple pie", fetch), attempts
+
+    assert asyncio.run(scenario()) == ({"calories": 52.0}, 2)
+
+
+def test_normalize_label():
+    assert normalize_label(" French_Fries ") == normalize_label("french-fries") == "french fries"
+    assert normalize_label("Pizza (Fast Food)") == "pizza (fast food)"
@@ -0,0 +1,69 @@
+"""Nutrition database built from a small Open Food Facts dump"""
+
+import json
+
+from nutrition import parse_nutriments
+from nutrition_db import NutritionDatabase, build_nutrition_db
+
+SAMPLE_PRODUCTS = [
+    {
+        # Complete, but energy in kJ only, as for many products in the dump
+        "code": "1",
+        "product_name": "Pizza margherita",
+        "categories_tags": ["en:pizzas"],
+        "unique_scans_n": 5,
+        "nutriments": {"energy_100g": 1046, "proteins_100g": 10, "fat_100g": 9, "carbohydrates_100g": 30},
+    },
+    {
+        # Far more scanned, but only energy parses as a number
+        "code": "2",
+        "product_name": "Pizza slice",
+        "categories_tags": ["en:pizzas"],
+        "unique_scans_n": 10000,
+        "nutriments": {"energy_100g": 500, "proteins_100g": "n/a", "fat_100g": "n/a", "carbohydrates_100g": "n/a"},
+    },
+    {
+        "code": "3",
+        "product_name": "Apple juice",
+        "categories_tags": ["en:juices"],
+        "unique_scans_n": 50,
+        "nutriments": {"energy-kcal_100g": 46, "proteins_100g": 0.1, "fat_100g": 0.1, "carbohydrates_100g": 11},
+    },
+]
+
+
+def build_sample_db(tmp_path):
+    dump = tmp_path / "products.jsonl"
+    dump.write_text("".join(json.dumps(product) + "\n" for product in SAMPLE_PRODUCTS))
+    output = tmp_path / "nutrition.db"
+    metadata = build_nutrition_db(str(dump), str(output))
+    assert metadata["products"] == len(SAMPLE_PRODUCTS)
+    return NutritionDatabase.open(str(output))
+
+
+def test_parse_nutriments_converts_kilojoules():
+    nutrition = parse_nutriments({"energy_100g": 1046, "proteins_100g": 10})
+    assert nutrition["calories"] == 250.0
+    assert nutrition["proteins"] == 10.0
+    assert nutrition["fats"] == 0.0
+
+
+def test_parse_nutriments_prefers_kcal():
+    assert parse_nutriments({"energy-kcal_100g": 200, "energy_100g": 1046})["calories"] == 200.0
+
+
+def test_kilojoule_only_product_is_stored_in_kcal(tmp_path):
+    db = build_sample_db(tmp_path)
+    assert db.lookup("pizza margherita")["calories"] == 250.0
+
+
+def test_complete_product_ranks_above_popular_incomplete_one(tmp_path):
+    db = build_sample_db(tmp_path)
+    nutrition = db.lookup("pizza")
+    assert nutrition == {"calories": 250.0, "proteins": 10.0, "fats": 9.0, "carbs": 30.0, "serving_size": "100g"}
+
+
+def test_category_suffix_falls_back_to_base_label(tmp_path):
+    db = build_sample_db(tmp_path)
+    assert db.lookup("apple juice (drink)")["calories"] == 46.0
+    assert db.lookup("no such food") is None
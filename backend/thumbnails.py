@@ -0,0 +1,291 @@
+"""Scan thumbnails for history, stored once per distinct upload"""
+
+import asyncio
+import io
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps, features
+from pymongo.errors import DuplicateKeyError
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+EXTENSIONS = {"image/webp": ".webp", "image/jpeg": ".jpg"}
+
+# Thumbnails are addressed by the SHA-256 of the upload they were made from
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+# Queued by ``close`` to tell the worker to stop
+_STOP = object()
+
+
+def thumbnail_format(requested):
+    """``requested`` (WEBP or JPEG) if Pillow can encode it, else JPEG"""
+    requested = requested.upper()
+    if requested == "WEBP" and not features.check("webp"):
+        logger.warning("Pillow was built without WebP support; writing JPEG thumbnails")
+        return "JPEG"
+    return requested if requested in CONTENT_TYPES else "JPEG"
+
+
+def make_thumbnail(image, size=160, image_format="WEBP", quality=75):
+    """Encode ``image`` scaled to fit in ``size`` x ``size``; returns the bytes
+
+    The EXIF orientation is applied, so phone photos come out upright.
+    """
+    thumbnail = ImageOps.exif_transpose(image)
+    thumbnail.thumbnail((size, size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+class Thumbnail:
+    """A stored thumbnail ready to stream: content type, length and a chunk iterator"""
+
+    def __init__(self, content_type, length, chunks):
+        self.content_type = content_type
+        self.length = length
+        self.chunks = chunks
+
+
+class FileThumbnailStore:
+    """Thumbnails as files under ``root``, fanned out by the first two hex digits"""
+
+    def __init__(self, root, chunk_size=64 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def _path(self, digest, content_type):
+        return os.path.join(self.root, digest[:2], digest + EXTENSIONS[content_type])
+
+    def _find(self, digest):
+        for content_type in EXTENSIONS:
+            path = self._path(digest, content_type)
+            if os.path.exists(path):
+                return path, content_type
+        return None, None
+
+    async def exists(self, digest):
+        return self._find(digest)[0] is not None
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def put(self, digest, data, content_type):
+        await asyncio.to_thread(self._write, self._path(digest, content_type), data)
+
+    async def _read_chunks(self, path):
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def open(self, digest):
+        path, content_type = self._find(digest)
+        if path is None:
+            return None
+        return Thumbnail(content_type, os.path.getsize(path), self._read_chunks(path))
+
+
+class GridFSThumbnailStore:
+    """Thumbnails in a GridFS bucket, with the digest as the file ``_id``"""
+
+    def __init__(self, db, bucket_name="thumbnails"):
+        self.db = db
+        self.bucket_name = bucket_name
+        self.files = db[f"{bucket_name}.files"]
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        # Created on first use: a Motor GridFS bucket binds the client to the
+        # current event loop, and the store may be built before it exists
+        if self._bucket is None:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+            self._bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name=self.bucket_name)
+        return self._bucket
+
+    async def exists(self, digest):
+        return await self.files.find_one({"_id": digest}, {"_id": 1}) is not None
+
+    async def put(self, digest, data, content_type):
+        try:
+            await self.bucket.upload_from_stream_with_id(
+                digest, digest + EXTENSIONS[content_type], data, metadata={"content_type": content_type}
+            )
+        except DuplicateKeyError:
+            # Another worker stored the same upload first
+            pass
+
+    async def _read_chunks(self, grid_out):
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    async def open(self, digest):
+        document = await self.files.find_one({"_id": digest})
+        if document is None:
+            return None
+        grid_out = await self.bucket.open_download_stream(digest)
+        content_type = (document.get("metadata") or {}).get("content_type", "image/jpeg")
+        return Thumbnail(content_type, document["length"], self._read_chunks(grid_out))
+
+
+class ThumbnailWriter:
+    """Makes and stores thumbnails in a background task, off the request path
+
+    ``submit`` queues a decoded image under the digest of its upload and
+    returns at once. Each digest is stored once: repeats already queued or
+    stored by this process are skipped without any work, and the worker
+    checks the store before encoding. When the queue is full new images
+    are dropped and get no thumbnail.
+
+    A scan's history record links its thumbnail as soon as it is queued.
+    If storing it then fails, or it is still queued when ``close`` runs
+    out of time, the link answers 404 until the same image is scanned
+    again.
+    """
+
+    def __init__(self, store, max_queue=100, size=160, image_format="WEBP", quality=75, max_known=10000):
+        self.store = store
+        self.max_queue = max_queue
+        self.size = size
+        self.image_format = thumbnail_format(image_format)
+        self.content_type = CONTENT_TYPES[self.image_format]
+        self.quality = quality
+        self.max_known = max_known
+        # Digests queued or stored by this process, most recent last
+        self._known = OrderedDict()
+        self._queue = None
+        self._task = None
+        self.submitted = 0
+        self.stored = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.failed = 0
+        self.encode_seconds = Histogram([0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25])
+        self.thumbnail_bytes = Histogram([2048, 4096, 8192, 16384, 32768, 65536])
+
+    def start(self):
+        """Start the background worker on the running event loop"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _remember(self, digest):
+        self._known[digest] = True
+        self._known.move_to_end(digest)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    def has(self, digest):
+        """Whether this process queued or stored a thumbnail for ``digest``"""
+        return digest in self._known
+
+    def submit(self, digest, image):
+        """Queue a thumbnail for ``image``; returns False if it was dropped"""
+        self.submitted += 1
+        if digest in self._known:
+            self.deduplicated += 1
+            self._known.move_to_end(digest)
+            return True
+        try:
+            self._queue.put_nowait((digest, image))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._remember(digest)
+        return True
+
+    async def _store(self, digest, image):
+        try:
+            if await self.store.exists(digest):
+                self.deduplicated += 1
+                return
+            started = time.perf_counter()
+            data = await asyncio.to_thread(make_thumbnail, image, self.size, self.image_format, self.quality)
+            self.encode_seconds.observe(time.perf_counter() - started)
+            self.thumbnail_bytes.observe(len(data))
+            await self.store.put(digest, data, self.content_type)
+            self.stored += 1
+        except Exception as e:
+            self.failed += 1
+            self._known.pop(digest, None)
+            logger.error(f"Could not store thumbnail {digest}: {str(e)}")
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            await self._store(*item)
+
+    async def close(self, timeout=10.0):
+        """Store what is still queued within ``timeout`` seconds, then stop the worker
+
+        Thumbnails not stored by then are dropped.
+        """
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+
+        async def stop():
+            await self._queue.put(_STOP)
+            await self._task
+
+        try:
+            await asyncio.wait_for(stop(), timeout)
+        except asyncio.TimeoutError:
+            # wait_for has cancelled the worker mid-store
+            logger.warning(f"Thumbnail writer did not finish within {timeout}s")
+
+        # Images submitted while the worker was finishing, or left when it was cut off
+        left = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                left.append(item)
+        while left:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._store(*left[0]), remaining)
+            except asyncio.TimeoutError:
+                break
+            left.pop(0)
+        if left:
+            self.dropped += len(left)
+            logger.warning(f"Dropped {len(left)} queued thumbnails at shutdown")
+        logger.info(f"Thumbnail writer stopped with {self.stored} thumbnails stored")
+
+    def stats(self):
+        return {
+            "store": type(self.store).__name__,
+            "format": self.image_format,
+            "size": self.size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "encode_seconds": self.encode_seconds.snapshot(),
+            "thumbnail_bytes": self.thumbnail_bytes.snapshot(),
+        }
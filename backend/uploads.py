@@ -0,0 +1,105 @@
+"""Bounded, chunked reading of image uploads"""
+
+import io
+import logging
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Stop looking for an image header after this many bytes; the full decode
+# later still rejects anything that isn't a valid image.
+HEADER_SNIFF_LIMIT = 256 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the per-file byte limit"""
+
+
+class UploadBudgetExceeded(Exception):
+    """Raised when the worker already holds too many upload bytes in memory"""
+
+
+class InvalidUpload(Exception):
+    """Raised when the upload's header shows it can't be used"""
+
+
+class UploadBudget:
+    """Caps the total bytes of uploads held in memory by this worker"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def reserve(self, size):
+        if self.in_flight + size > self.max_bytes:
+            self.rejected += 1
+            raise UploadBudgetExceeded(f"{self.in_flight} upload bytes already in flight")
+        self.in_flight += size
+        self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        self.in_flight -= size
+
+    def stats(self):
+        return {
+            "in_flight_bytes": self.in_flight,
+            "peak_bytes": self.peak,
+            "max_bytes": self.max_bytes,
+            "rejected": self.rejected,
+        }
+
+
+def sniff_image_header(data):
+    """Return ``(format, size)`` from the start of an image, or None if incomplete
+
+    ``Image.open`` only parses the header and allocates no pixel memory.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format, image.size
+    except Image.DecompressionBombError:
+        raise InvalidUpload("Image too large. Please upload a smaller image.")
+    except Exception:
+        return None
+
+
+async def read_upload(file, max_bytes, budget, validate_header=None, chunk_size=64 * 1024):
+    """Read an ``UploadFile`` in chunks and return its bytes
+
+    Every chunk is charged to ``budget`` and the upload is abandoned as
+    soon as it passes ``max_bytes``. ``validate_header(format, size)`` is
+    called once the image header has arrived and may raise
+    ``InvalidUpload`` to reject the file before the rest is read.
+
+    The caller owns the reservation of ``len(result)`` bytes and must
+    release it from ``budget`` when it no longer needs the data.
+    """
+    chunks = []
+    reserved = 0
+    header_checked = validate_header is None
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            if reserved + len(chunk) > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            budget.reserve(len(chunk))
+            reserved += len(chunk)
+            chunks.append(chunk)
+
+            if not header_checked:
+                header = sniff_image_header(b"".join(chunks))
+                if header is not None:
+                    validate_header(*header)
+                    header_checked = True
+                elif reserved >= HEADER_SNIFF_LIMIT:
+                    header_checked = True
+    except BaseException:
+        budget.release(reserved)
+        raise
+
+    return b"".join(chunks)